@@ -4,30 +4,214 @@ Complete E-Commerce Website with Order Management
 Copyright © 2025 Sagar Kohli. All Rights Reserved.
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify, abort,
+                   make_response, Response, stream_with_context, g, has_request_context,
+                   before_render_template, template_rendered)
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from flask_sqlalchemy.session import Session
+from markupsafe import Markup
+import click
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from functools import wraps
+from bisect import bisect_left
+from itertools import groupby, islice
+from types import SimpleNamespace
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.pool import QueuePool
+import csv
+import hashlib
+import importlib
+import io
+import json
+import math
 import os
+import re
 import secrets
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import warnings
 
 app = Flask(__name__)
 
+
+def load_secret_key():
+    """SECRET_KEY from the environment, else one generated once and kept in the instance folder
+
+    Every worker and every restart then signs sessions with the same key, so
+    carts and admin logins survive whichever worker serves the next request.
+    """
+    if os.environ.get('SECRET_KEY'):
+        return os.environ['SECRET_KEY']
+
+    path = os.path.join(app.instance_path, 'secret_key')
+    if not os.path.exists(path):
+        os.makedirs(app.instance_path, exist_ok=True)
+        draft = f'{path}.{os.getpid()}'
+        with open(os.open(draft, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as out:
+            out.write(secrets.token_hex(32))
+        try:
+            os.link(draft, path)  # atomic - a worker racing us keeps its own draft out
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(draft)
+    with open(path) as key_file:
+        return key_file.read().strip()
+
+
 # Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+app.config['SECRET_KEY'] = load_secret_key()
+
+# Connection pool per worker: one connection per gunicorn thread plus a little overflow
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 4)))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Seconds before a pooled connection is replaced - keep below the host's idle disconnect
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 300))
+# Seconds a SQLite writer waits for the lock instead of failing with "database is locked"
+app.config['SQLITE_BUSY_TIMEOUT'] = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 15))
+
+
+def database_url(url):
+    """SQLAlchemy URL for a DATABASE_URL - Render and Heroku still hand out postgres://"""
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def engine_options(url):
+    """Pool settings for one database
+
+    Every worker opens at most workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    connections in total, which must stay below the server's limit.
+    Pre-ping and recycle swap out connections the host closed while the
+    app sat idle, instead of failing the next request with them.
+    """
+    if url.startswith('sqlite'):
+        return {'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT']}}
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
 
 # Database configuration - PERSISTENT SQL DATABASE
-if os.environ.get('DATABASE_URL'):
-    database_url = os.environ.get('DATABASE_URL')
-    if database_url.startswith('postgres://'):
-        database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///himgaon_dairy.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url(os.environ.get('DATABASE_URL', 'sqlite:///himgaon_dairy.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Optional read replica for the read-only pages (storefront, tracking, admin listings)
+if os.environ.get('DATABASE_REPLICA_URL'):
+    replica_url = database_url(os.environ['DATABASE_REPLICA_URL'])
+    app.config['SQLALCHEMY_BINDS'] = {'replica': dict(engine_options(replica_url), url=replica_url)}
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+# Order numbers reserved per worker in one round trip (gaps are fine, duplicates are not)
+app.config['ORDER_ID_BLOCK_SIZE'] = int(os.environ.get('ORDER_ID_BLOCK_SIZE', 10))
+
+# Seconds a worker trusts its catalog cache before re-checking the version stamp
+app.config['CATALOG_CACHE_TTL'] = float(os.environ.get('CATALOG_CACHE_TTL', 10))
+
+# Seconds the storefront shows the same unreserved stock numbers before re-reading them
+app.config['AVAILABILITY_TTL'] = float(os.environ.get('AVAILABILITY_TTL', 5))
+
+# Seconds the admin dashboard numbers are reused before being read again
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('DASHBOARD_CACHE_TTL', 15))
+
+# Where carts live: 'sql' (the app database), 'redis' (needs REDIS_URL) or 'memory' (single process only)
+app.config['CART_BACKEND'] = os.environ.get('CART_BACKEND', 'sql')
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')
+app.config['CART_TTL_DAYS'] = int(os.environ.get('CART_TTL_DAYS', 30))
+
+# Minutes stock stays held for a cart after the customer last touched it
+app.config['RESERVATION_TTL_MINUTES'] = int(os.environ.get('RESERVATION_TTL_MINUTES', 15))
+
+# Hours a checkout form's token keeps absorbing repeated submits
+app.config['CHECKOUT_TOKEN_TTL_HOURS'] = int(os.environ.get('CHECKOUT_TOKEN_TTL_HOURS', 24))
+
+# Per-endpoint latency/query metrics on /metrics; METRICS_TOKEN, when set, must be sent as a Bearer token
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# Requests slower than this many milliseconds are logged with their SQL (0 turns the log off)
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Dairy location the delivery runs start from, and the litres + kg one vehicle carries per run
+app.config['DEPOT_LAT'] = float(os.environ.get('DEPOT_LAT', 29.5830))
+app.config['DEPOT_LON'] = float(os.environ.get('DEPOT_LON', 80.2180))
+app.config['DELIVERY_RUN_CAPACITY'] = float(os.environ.get('DELIVERY_RUN_CAPACITY', 300))
+
+# Delivered/rejected orders older than this many days move to the archive tables
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+
+# Where order notifications go: 'stdout', 'file:<path>' (one JSON line per message) or
+# 'module:factory' - a callable taking the app config that returns an object with send(message)
+app.config['NOTIFY_TRANSPORT'] = os.environ.get('NOTIFY_TRANSPORT', 'stdout')
+# The dairy's own contact for new-order alerts (empty to skip)
+app.config['DAIRY_NOTIFY_EMAIL'] = os.environ.get('DAIRY_NOTIFY_EMAIL', '')
+# Send attempts per message before it is given up, backoff doubles from OUTBOX_RETRY_SECONDS
+app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+app.config['OUTBOX_RETRY_SECONDS'] = float(os.environ.get('OUTBOX_RETRY_SECONDS', 30))
+
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica during requests marked with @read_replica
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary,
+    so a routed request that does write cannot write to the replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not getattr(clause, 'is_dml', False)
+                and has_request_context() and g.get('read_replica')):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def primary_bind():
+    """bind_arguments that keep a read on the primary even inside a @read_replica view
+
+    For loads behind caches shared by the whole worker: a lagging replica
+    must not drag them back to older data.
+    """
+    return {'bind': db.engine}
+
+
+def read_replica(f):
+    """Serve a read-only view from DATABASE_REPLICA_URL when one is configured"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a checkout writes; NORMAL sync is safe with WAL
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 
 # ==================== DATABASE MODELS ====================
 
@@ -43,9 +227,17 @@ class Product(db.Model):
     description_hi = db.Column(db.Text, nullable=True)
     image_url = db.Column(db.String(500), nullable=True)
     stock = db.Column(db.Integer, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     category = db.Column(db.String(50), nullable=True)
+    sku = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_products_stock', 'stock'),
+        db.Index('ix_products_sku', 'sku', unique=True),
+        db.Index('ix_products_category', 'category'),
+    )
+
     def __repr__(self):
         return f'<Product {self.name_en}>'
 
@@ -65,12 +257,26 @@ class Order(db.Model):
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
     admin_notes = db.Column(db.Text, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    delivery_zone = db.Column(db.String(20), nullable=True)
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
 
+    # Keyset pagination walks (order_date, id) newest first, optionally within one status
+    __table_args__ = (
+        db.Index('ix_orders_order_date_id', 'order_date', 'id'),
+        db.Index('ix_orders_status_order_date_id', 'status', 'order_date', 'id'),
+        db.Index('ix_orders_phone', 'phone'),
+        db.Index('ix_orders_order_id_phone', 'order_id', 'phone'),
+        db.Index('ix_orders_status_delivery_zone', 'status', 'delivery_zone'),
+    )
+
     def __repr__(self):
         return f'<Order {self.order_id}>'
 
 
+# Name search ignores case, so the index is on the lowercased name
+db.Index('ix_orders_customer_name_lower', db.func.lower(Order.customer_name))
+
+
 class OrderItem(db.Model):
     """Order items - Linked to orders"""
     __tablename__ = 'order_items'
@@ -84,26 +290,1787 @@ class OrderItem(db.Model):
     price = db.Column(db.Float, nullable=False)
     product = db.relationship('Product', backref='order_items')
 
+    __table_args__ = (
+        db.Index('ix_order_items_order_id', 'order_id'),
+    )
+
+
+class ArchivedOrder(db.Model):
+    """Closed order moved out of the hot orders table - same columns, same id"""
+    __tablename__ = 'archived_orders'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.String(20), unique=True, nullable=False)
+    customer_name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    address = db.Column(db.Text, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20))
+    order_date = db.Column(db.DateTime)
+    admin_notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime)
+    delivery_zone = db.Column(db.String(20), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    items = db.relationship('ArchivedOrderItem', lazy=True, order_by='ArchivedOrderItem.id')
+
+    __table_args__ = (
+        db.Index('ix_archived_orders_order_id_phone', 'order_id', 'phone'),
+        db.Index('ix_archived_orders_order_date', 'order_date'),
+    )
+
+
+class ArchivedOrderItem(db.Model):
+    """Line of an archived order - product_id has no foreign key so products can still be deleted"""
+    __tablename__ = 'archived_order_items'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_orders.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    product_name_en = db.Column(db.String(100), nullable=False)
+    product_name_hi = db.Column(db.String(100), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_archived_order_items_order_id', 'order_id'),
+    )
+
+
+class SchemaMigration(db.Model):
+    """Schema migrations already applied to this database"""
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class OrderSequence(db.Model):
+    """Per-year order number counter - one row per calendar year"""
+    __tablename__ = 'order_sequences'
+
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CartItem(db.Model):
+    """Server-side cart line - the session cookie only carries the cart id"""
+    __tablename__ = 'cart_items'
+
+    cart_id = db.Column(db.String(32), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+class Reservation(db.Model):
+    """Stock held for a cart until expires_at - mirrored in Product.reserved"""
+    __tablename__ = 'reservations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cart_id = db.Column(db.String(32), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_reservations_cart_product', 'cart_id', 'product_id', unique=True),
+        db.Index('ix_reservations_expires_at', 'expires_at'),
+    )
+
+
+class StockMovement(db.Model):
+    """Append-only stock ledger - Product.stock always equals the sum of its changes
+
+    product_id has no foreign key so history survives a product delete.
+    """
+    __tablename__ = 'stock_movements'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    change = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # opening, sale, restock, adjustment, reject_restore
+    order_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stock_movements_product_id_id', 'product_id', 'id'),
+    )
+
+
+class CheckoutToken(db.Model):
+    """Idempotency key of one checkout form - a repeated submit finds the order it already placed"""
+    __tablename__ = 'checkout_tokens'
+
+    token = db.Column(db.String(64), primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class OutboxMessage(db.Model):
+    """Notification written in the same transaction as the order change it announces"""
+    __tablename__ = 'outbox_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(20), nullable=False)  # placed, accepted, rejected, delivered
+    order_id = db.Column(db.String(20), nullable=False)
+    channel = db.Column(db.String(10), nullable=False)  # email, sms
+    recipient = db.Column(db.String(120), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(500), nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_outbox_messages_sent_at_next_attempt_at', 'sent_at', 'next_attempt_at'),
+    )
+
+
+class StockSnapshot(db.Model):
+    """Ledger total per product up to last_movement_id, taken periodically"""
+    __tablename__ = 'stock_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    last_movement_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stock_snapshots_product_id_taken_at', 'product_id', 'taken_at'),
+    )
+
+
+class Subscription(db.Model):
+    """Standing daily-delivery order, e.g. 1 L cow milk every day"""
+    __tablename__ = 'subscriptions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    address = db.Column(db.Text, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    days_mask = db.Column(db.Integer, nullable=False, default=127)  # bit 0 = Monday ... bit 6 = Sunday
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    pauses = db.relationship('SubscriptionPause', backref='subscription', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_subscriptions_active', 'active'),
+    )
+
+
+class SubscriptionPause(db.Model):
+    """No deliveries for a subscription from start_date to end_date inclusive"""
+    __tablename__ = 'subscription_pauses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=False, index=True)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+
+class SubscriptionDelivery(db.Model):
+    """One row per subscription and delivery date - makes the generator idempotent"""
+    __tablename__ = 'subscription_deliveries'
+
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), primary_key=True)
+    delivery_date = db.Column(db.Date, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+
+
+class DailyProductSales(db.Model):
+    """Sales rollup per order day and product - rejected orders are taken back out"""
+    __tablename__ = 'daily_product_sales'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    category = db.Column(db.String(50), nullable=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class DeliveryZone(db.Model):
+    """Delivery area (usually a pincode) with the point its drop-offs are routed to"""
+    __tablename__ = 'delivery_zones'
+
+    code = db.Column(db.String(20), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    aliases = db.Column(db.Text, nullable=True)  # comma separated village/locality names
+    lat = db.Column(db.Float, nullable=True)
+    lon = db.Column(db.Float, nullable=True)
+
+
+class CacheVersion(db.Model):
+    """Version stamps shared by all workers - bumped whenever cached data changes"""
+    __tablename__ = 'cache_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class OrderStat(db.Model):
+    """Order count and revenue per order day and current status
+
+    Kept up to date by place_order and the accept/reject/deliver routes so
+    the dashboard never has to scan the orders table.
+    """
+    __tablename__ = 'order_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+# ==================== CATALOG CACHE ====================
+
+CatalogItem = namedtuple('CatalogItem', [
+    'id', 'name_en', 'name_hi', 'price', 'description_en', 'description_hi',
+    'image_url', 'stock', 'category',
+])
+
+
+def current_catalog_version():
+    """Read the shared catalog version stamp (single primary key lookup on the primary)"""
+    version = db.session.scalar(db.select(CacheVersion.version).where(CacheVersion.name == 'catalog'),
+                                bind_arguments=primary_bind())
+    return version or 0
+
+
+def bump_catalog_version():
+    """Mark the catalog as changed inside the current transaction
+
+    Other workers notice the new stamp on their next TTL check; this worker
+    drops its copy as soon as the transaction commits.
+    """
+    result = db.session.execute(
+        db.update(CacheVersion)
+        .where(CacheVersion.name == 'catalog')
+        .values(version=CacheVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.add(CacheVersion(name='catalog', version=1))
+    db.session.info['catalog_changed'] = True
+
+
+class CatalogCache:
+    """In-process snapshot of the product catalog
+
+    Within the TTL lookups never touch the database. After the TTL one
+    primary key read of the version stamp decides whether the snapshot is
+    still good, so a full reload only happens after a real change. Both
+    reads go to the primary, so @read_replica pages and checkout share one
+    snapshot that never moves backwards.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._products = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def products(self):
+        return list(self._load()[1].values())
+
+    def get(self, product_id):
+        return self._load()[1].get(product_id)
+
+    def snapshot(self):
+        """Return (version, products) taken from the same load"""
+        version, products = self._load()
+        return version, list(products.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._products = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'version': self._version,
+                'size': len(self._products) if self._products is not None else 0,
+                'ttl': self.ttl,
+            }
+
+    def _load(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._products is not None and now - self._checked_at < self.ttl:
+                self.hits += 1
+                return self._version, self._products
+
+        version = current_catalog_version()
+        with self._lock:
+            if self._products is not None and version == self._version:
+                self._checked_at = now
+                self.hits += 1
+                return self._version, self._products
+
+        rows = db.session.execute(
+            db.select(Product.id, Product.name_en, Product.name_hi, Product.price, Product.description_en,
+                      Product.description_hi, Product.image_url, Product.stock, Product.category)
+            .order_by(Product.id),
+            bind_arguments=primary_bind())
+        products = {row[0]: CatalogItem(*row) for row in rows}
+
+        with self._lock:
+            self._products = products
+            self._version = version
+            self._checked_at = now
+            self.misses += 1
+        return version, products
+
+
+catalog_cache = CatalogCache(ttl=app.config['CATALOG_CACHE_TTL'])
+
+
+class AvailabilityCache:
+    """Unreserved stock (stock - reserved) per product, re-read every ttl seconds
+
+    Cart holds change `reserved` all the time, so availability is kept
+    apart from the catalog version: a hold never reloads the catalog or
+    re-renders its fragments. The stamp is a hash of the numbers, the same
+    in every worker, so pages can use it in their ETag.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._available = None
+        self._loaded_at = 0.0
+
+    def get(self):
+        """Return (stamp, {product_id: unreserved stock})"""
+        now = time.monotonic()
+        with self._lock:
+            if self._available is not None and now - self._loaded_at < self.ttl:
+                return self._stamp, self._available
+
+        available = dict(db.session.execute(
+            db.select(Product.id, Product.stock - Product.reserved).order_by(Product.id),
+            bind_arguments=primary_bind()).all())
+        stamp = hashlib.sha1(repr(sorted(available.items())).encode()).hexdigest()[:12]
+        with self._lock:
+            self._stamp, self._available, self._loaded_at = stamp, available, now
+        return stamp, available
+
+    def invalidate(self):
+        with self._lock:
+            self._available = None
+
+
+availability_cache = AvailabilityCache(ttl=app.config['AVAILABILITY_TTL'])
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_catalog_after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.invalidate()
+        availability_cache.invalidate()
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def _forget_catalog_change(session, previous_transaction):
+    session.info.pop('catalog_changed', None)
+
+
+# ==================== PRODUCT SEARCH ====================
+
+# Latin/digit runs, or Devanagari runs including their vowel signs and virama (danda splits words)
+SEARCH_TOKEN = re.compile(r'[a-z0-9]+|[\u0900-\u0963\u0966-\u097f]+')
+# Spelling variants folded together: nukta dropped, chandrabindu written as anusvara
+DEVANAGARI_FOLD = str.maketrans({'\u093c': None, '\u0901': '\u0902'})
+SEARCH_FIELDS = ('name_en', 'name_hi', 'description_en', 'description_hi', 'category')
+
+
+def search_tokens(text):
+    text = unicodedata.normalize('NFC', text or '').lower().translate(DEVANAGARI_FOLD)
+    return SEARCH_TOKEN.findall(text)
+
+
+class ProductSearch:
+    """Inverted index over the catalog snapshot, in English and Hindi
+
+    sync() diffs each new catalog version against the indexed one and only
+    re-tokenizes products whose text changed, so stock updates from
+    checkouts cost nothing. Every query term must match; the last one also
+    matches as a prefix for type-ahead. Name matches rank above
+    description matches.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._texts = {}        # product id -> indexed field values
+        self._postings = {}     # token -> {product id: weight}
+        self._terms = []        # sorted tokens for prefix lookups
+        self._categories = {}   # category -> sorted product ids
+        self._products = {}
+
+    def sync(self, version, products):
+        with self._lock:
+            if version == self._version:
+                return
+            current = {product.id: product for product in products}
+            for product_id in set(self._texts) - set(current):
+                self._remove(product_id)
+            for product in products:
+                fields = tuple(getattr(product, field) for field in SEARCH_FIELDS)
+                if self._texts.get(product.id) != fields:
+                    self._remove(product.id)
+                    self._add(product.id, fields)
+            self._terms = sorted(self._postings)
+            categories = {}
+            for product in products:
+                categories.setdefault((product.category or '').lower(), []).append(product.id)
+            self._categories = categories
+            self._products = current
+            self._version = version
+
+    def _add(self, product_id, fields):
+        self._texts[product_id] = fields
+        for field, text in zip(SEARCH_FIELDS, fields):
+            weight = 3 if field.startswith('name') else 1
+            for token in search_tokens(text):
+                postings = self._postings.setdefault(token, {})
+                postings[product_id] = max(postings.get(product_id, 0), weight)
+
+    def _remove(self, product_id):
+        fields = self._texts.pop(product_id, None)
+        if fields is None:
+            return
+        for token in {token for text in fields for token in search_tokens(text)}:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def _matches(self, term, prefix):
+        if not prefix:
+            return self._postings.get(term, {})
+        found = {}
+        for i in range(bisect_left(self._terms, term), len(self._terms)):
+            token = self._terms[i]
+            if not token.startswith(term):
+                break
+            for product_id, weight in self._postings[token].items():
+                found[product_id] = max(found.get(product_id, 0), weight)
+        return found
+
+    def search(self, query='', category=''):
+        """Products matching every term of query, best first, optionally within one category"""
+        with self._lock:
+            category = category.lower()
+            if category and category not in self._categories:
+                return []
+            terms = search_tokens(query)
+            if not terms:
+                ids = self._categories[category] if category else sorted(self._products)
+                return [self._products[product_id] for product_id in ids]
+
+            scores = None
+            for i, term in enumerate(terms):
+                matches = self._matches(term, prefix=i == len(terms) - 1)
+                if scores is None:
+                    scores = dict(matches)
+                else:
+                    scores = {pid: score + matches[pid] for pid, score in scores.items() if pid in matches}
+                if not scores:
+                    return []
+            if category:
+                allowed = set(self._categories[category])
+                scores = {pid: score for pid, score in scores.items() if pid in allowed}
+            return [self._products[pid] for pid in sorted(scores, key=lambda pid: (-scores[pid], pid))]
+
+    def categories(self):
+        with self._lock:
+            return sorted(category for category in self._categories if category)
+
+
+product_search = ProductSearch()
+
+
+def search_catalog(query='', category=''):
+    """(catalog version, matching products) for the current catalog snapshot"""
+    version, products = catalog_cache.snapshot()
+    product_search.sync(version, products)
+    return version, product_search.search(query, category)
+
+
+# ==================== DASHBOARD STATS ====================
+
+def record_order_stat(day, status, orders, revenue):
+    """Add to the (day, status) counter row inside the current transaction"""
+    increment = (
+        db.update(OrderStat)
+        .where(OrderStat.day == day, OrderStat.status == status)
+        .values(orders=OrderStat.orders + orders, revenue=OrderStat.revenue + revenue)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(increment).rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.add(OrderStat(day=day, status=status, orders=orders, revenue=revenue))
+        except IntegrityError:
+            # Another worker created the row first
+            db.session.execute(increment)
+    db.session.info['dashboard_changed'] = True
+
+
+def count_new_order(order):
+    """Count a freshly placed order in the dashboard counters"""
+    record_order_stat(order.order_date.date(), order.status, 1, order.total_amount)
+
+
+def move_order_stats(orders, new_status):
+    """Move orders between counters, one pair of updates per (day, old status)"""
+    moves = {}
+    for order in orders:
+        if order.status == new_status:
+            continue
+        key = (order.order_date.date(), order.status)
+        count, revenue = moves.get(key, (0, 0.0))
+        moves[key] = (count + 1, revenue + order.total_amount)
+
+    for (day, old_status), (count, revenue) in moves.items():
+        record_order_stat(day, old_status, -count, -revenue)
+        record_order_stat(day, new_status, count, revenue)
+
+
+def move_order_status(order, new_status, **values):
+    """Change an order's status and move it between dashboard counters
+
+    The UPDATE only matches while the order still has the status read
+    earlier in the request, so of two concurrent clicks exactly one moves
+    the counters. Extra column `values` are written with it. Returns False
+    when the order was already in (or moved away from) that status.
+    """
+    old_status = order.status
+    if old_status == new_status:
+        return False
+    values['updated_at'] = datetime.utcnow()
+    result = db.session.execute(
+        db.update(Order)
+        .where(Order.id == order.id, Order.status == old_status)
+        .values(status=new_status, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    move_order_stats([order], new_status)
+    for name, value in dict(values, status=new_status).items():
+        set_committed_value(order, name, value)
+    return True
+
+
+def rebuild_order_stats():
+    """Recompute every counter row from the hot and archived orders in one GROUP BY"""
+    orders = all_orders('order_date', 'status', 'total_amount')
+    day = db.func.date(orders.c.order_date)
+    rows = db.session.execute(
+        db.select(day, orders.c.status, db.func.count(), db.func.sum(orders.c.total_amount))
+        .group_by(day, orders.c.status)
+    ).all()
+
+    db.session.execute(db.delete(OrderStat))
+    for order_day, status, orders, revenue in rows:
+        if isinstance(order_day, str):  # SQLite returns date() as text
+            order_day = datetime.strptime(order_day, '%Y-%m-%d').date()
+        db.session.add(OrderStat(day=order_day, status=status, orders=orders, revenue=revenue or 0.0))
+    db.session.info['dashboard_changed'] = True
+
+
+class DashboardCache:
+    """Dashboard numbers reused for a short TTL within one worker"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+
+    def get(self, load):
+        now = time.monotonic()
+        with self._lock:
+            if self._data is not None and now - self._loaded_at < self.ttl:
+                return self._data
+
+        data = load()
+        with self._lock:
+            self._data = data
+            self._loaded_at = now
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+
+dashboard_cache = DashboardCache(ttl=app.config['DASHBOARD_CACHE_TTL'])
+
+
+def load_dashboard_stats(days=14):
+    """Status totals plus per-day tiles, all read from order_stats"""
+    totals = dict(db.session.execute(
+        db.select(OrderStat.status, db.func.sum(OrderStat.orders)).group_by(OrderStat.status)
+    ).all())
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = {}
+    for stat in OrderStat.query.filter(OrderStat.day >= since).order_by(OrderStat.day.desc()):
+        tile = daily.setdefault(stat.day, {'revenue': 0.0, 'statuses': {}})
+        tile['statuses'][stat.status] = stat.orders
+        if stat.status != 'Rejected':
+            tile['revenue'] += stat.revenue
+
+    return {
+        'status_totals': {status: count or 0 for status, count in totals.items()},
+        'daily': sorted(daily.items(), reverse=True),
+        'recent_orders': Order.query.order_by(Order.order_date.desc(), Order.id.desc()).limit(5).all(),
+    }
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_dashboard_after_commit(session):
+    if session.info.pop('dashboard_changed', False):
+        dashboard_cache.invalidate()
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def _forget_dashboard_change(session, previous_transaction):
+    session.info.pop('dashboard_changed', None)
+
+
+# ==================== PAGE CACHE ====================
+
+def _template_stamp():
+    """Fingerprint of the deployed templates - identical across workers"""
+    root = os.path.join(app.root_path, app.template_folder)
+    stamps = []
+    for folder, _, files in os.walk(root):
+        for name in files:
+            stat = os.stat(os.path.join(folder, name))
+            stamps.append((name, stat.st_mtime_ns, stat.st_size))
+    return hashlib.sha1(repr(sorted(stamps)).encode()).hexdigest()[:12]
+
+
+TEMPLATE_STAMP = _template_stamp()
+
+
+class FragmentCache:
+    """Rendered HTML fragments keyed by (catalog version, language)
+
+    The version may also carry the availability stamp. Only fragments of
+    the newest version are kept, so the cache never holds more than one
+    entry per language.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fragments = {}
+
+    def get_or_render(self, version, lang, render):
+        key = (version, lang)
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self.hits += 1
+                return fragment
+
+        fragment = Markup(render())
+        with self._lock:
+            self._fragments = {k: v for k, v in self._fragments.items() if k[0] == version}
+            self._fragments[key] = fragment
+            self.misses += 1
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments = {}
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._fragments)}
+
+
+fragment_cache = FragmentCache()
+
+
+def page_etag(*parts):
+    """Strong ETag built from everything a storefront page renders"""
+    key = (
+        TEMPLATE_STAMP,
+        session.get('language', 'en'),
+        session.get('cart_count', 0),
+        bool(session.get('admin_logged_in')),
+    ) + parts
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def not_modified(etag):
+    """304 response when the client already holds this page, else None"""
+    if '_flashes' in session or not request.if_none_match.contains(etag):
+        return None
+    return with_etag(app.response_class(status=304), etag)
+
+
+def with_etag(response, etag):
+    """Attach the ETag to a page - pages with flash messages are never tagged"""
+    response = make_response(response)
+    if '_flashes' not in session and response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+    return response
+
+
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_LOG_STATEMENTS = 50
+
+
+class RequestMetrics:
+    """Per-endpoint request counters and latency histograms for this worker
+
+    One lock acquisition per request keeps the overhead to a few
+    microseconds, so it stays on in production. Each gunicorn worker
+    reports its own numbers - Prometheus sums them per instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._statuses = {}
+
+    def observe(self, endpoint, status, seconds, queries, sql_seconds, template_seconds):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'seconds': 0.0,
+                    'queries': 0, 'sql_seconds': 0.0, 'template_seconds': 0.0,
+                }
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+                    break
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['queries'] += queries
+            stats['sql_seconds'] += sql_seconds
+            stats['template_seconds'] += template_seconds
+            key = (endpoint, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            endpoints = {name: dict(stats, buckets=list(stats['buckets'])) for name, stats in self._endpoints.items()}
+            statuses = dict(self._statuses)
+
+        lines = ['# TYPE himgaon_request_seconds histogram']
+        for name, stats in sorted(endpoints.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                cumulative += count
+                lines.append(f'himgaon_request_seconds_bucket{{endpoint="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'himgaon_request_seconds_bucket{{endpoint="{name}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'himgaon_request_seconds_sum{{endpoint="{name}"}} {stats["seconds"]:.6f}')
+            lines.append(f'himgaon_request_seconds_count{{endpoint="{name}"}} {stats["count"]}')
+
+        for metric, key, kind in (('himgaon_sql_queries_total', 'queries', 'd'),
+                                  ('himgaon_sql_seconds_total', 'sql_seconds', '.6f'),
+                                  ('himgaon_template_seconds_total', 'template_seconds', '.6f')):
+            lines.append(f'# TYPE {metric} counter')
+            lines += [f'{metric}{{endpoint="{name}"}} {stats[key]:{kind}}' for name, stats in sorted(endpoints.items())]
+
+        lines.append('# TYPE himgaon_responses_total counter')
+        lines += [f'himgaon_responses_total{{endpoint="{name}",status="{status}"}} {count}'
+                  for (name, status), count in sorted(statuses.items())]
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+@app.before_request
+def _start_request_timer():
+    if app.config['METRICS_ENABLED']:
+        g.metrics = {'start': time.perf_counter(), 'queries': 0, 'sql_seconds': 0.0,
+                     'template_seconds': 0.0, 'template_depth': 0, 'statements': []}
+
+
+@app.after_request
+def _record_request_metrics(response):
+    metrics = g.pop('metrics', None)
+    if metrics is None:
+        return response
+
+    seconds = time.perf_counter() - metrics['start']
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.observe(endpoint, response.status_code, seconds, metrics['queries'],
+                            metrics['sql_seconds'], metrics['template_seconds'])
+
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if slow_ms and seconds * 1000 >= slow_ms:
+        app.logger.warning('Slow request %s %s (%s): %.0f ms, %d queries, %.0f ms SQL, %.0f ms templates\n%s',
+                           request.method, request.path, endpoint, seconds * 1000, metrics['queries'],
+                           metrics['sql_seconds'] * 1000, metrics['template_seconds'] * 1000,
+                           '\n'.join(metrics['statements']))
+    return response
+
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics' in g:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started or not has_request_context() or 'metrics' not in g:
+        return
+    metrics = g.metrics
+    metrics['queries'] += 1
+    metrics['sql_seconds'] += time.perf_counter() - started.pop()
+    if len(metrics['statements']) < SLOW_LOG_STATEMENTS:
+        metrics['statements'].append(' '.join(statement.split()))
+
+
+@before_render_template.connect_via(app)
+def _start_template_timer(sender, template, context, **extra):
+    metrics = g.get('metrics')
+    if metrics is not None:
+        if metrics['template_depth'] == 0:
+            metrics['template_started'] = time.perf_counter()
+        metrics['template_depth'] += 1
+
+
+@template_rendered.connect_via(app)
+def _record_template_time(sender, template, context, **extra):
+    metrics = g.get('metrics')
+    if metrics is not None and metrics['template_depth']:
+        metrics['template_depth'] -= 1
+        if metrics['template_depth'] == 0:
+            metrics['template_seconds'] += time.perf_counter() - metrics['template_started']
+
+
+def pool_stats():
+    """Connection pool usage of every engine in this worker"""
+    stats = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        entry = {'class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                         overflow=pool.overflow())
+        stats[key or 'primary'] = entry
+    return stats
+
+
+def render_pool_metrics():
+    lines = []
+    pools = pool_stats()
+    for field in ('size', 'checked_out', 'checked_in', 'overflow'):
+        lines.append(f'# TYPE himgaon_db_pool_{field} gauge')
+        lines += [f'himgaon_db_pool_{field}{{bind="{bind}"}} {entry[field]}'
+                  for bind, entry in sorted(pools.items()) if field in entry]
+    return '\n'.join(lines) + '\n'
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint for this worker"""
+    token = app.config['METRICS_TOKEN']
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(request_metrics.render() + render_pool_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# ==================== CART STORE ====================
+
+class MemoryCartStore:
+    """Carts in a process-local dict - for development and single-worker runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carts = {}
+
+    def items(self, cart_id):
+        with self._lock:
+            return dict(self._carts.get(cart_id, {}))
+
+    def quantity(self, cart_id, product_id):
+        with self._lock:
+            return self._carts.get(cart_id, {}).get(product_id, 0)
+
+    def set(self, cart_id, product_id, quantity):
+        with self._lock:
+            cart = self._carts.setdefault(cart_id, {})
+            if quantity > 0:
+                cart[product_id] = quantity
+            else:
+                cart.pop(product_id, None)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def purge(self, older_than):
+        return 0
+
+
+class SqlCartStore:
+    """Carts in the cart_items table, keyed by (cart_id, product_id)"""
+
+    def items(self, cart_id):
+        rows = db.session.execute(
+            db.select(CartItem.product_id, CartItem.quantity).where(CartItem.cart_id == cart_id)
+        ).all()
+        return dict(rows)
+
+    def quantity(self, cart_id, product_id):
+        line = db.session.get(CartItem, (cart_id, product_id))
+        return line.quantity if line else 0
+
+    def set(self, cart_id, product_id, quantity):
+        line = db.session.get(CartItem, (cart_id, product_id))
+        if quantity <= 0:
+            if line:
+                db.session.delete(line)
+        elif line:
+            line.quantity = quantity
+        else:
+            db.session.add(CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity))
+        db.session.commit()
+
+    def clear(self, cart_id):
+        db.session.execute(db.delete(CartItem).where(CartItem.cart_id == cart_id))
+        db.session.commit()
+
+    def purge(self, older_than):
+        """Delete carts idle since before `older_than`, returns lines removed"""
+        result = db.session.execute(db.delete(CartItem).where(CartItem.updated_at < older_than))
+        db.session.commit()
+        return result.rowcount
+
+
+class RedisCartStore:
+    """Carts as Redis hashes (cart:<id> -> {product_id: quantity}) that expire on their own"""
+
+    def __init__(self, url, ttl_days):
+        import redis  # optional dependency, only needed for CART_BACKEND=redis
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = int(timedelta(days=ttl_days).total_seconds())
+
+    def items(self, cart_id):
+        return {int(k): int(v) for k, v in self.redis.hgetall(f'cart:{cart_id}').items()}
+
+    def quantity(self, cart_id, product_id):
+        return int(self.redis.hget(f'cart:{cart_id}', product_id) or 0)
+
+    def set(self, cart_id, product_id, quantity):
+        key = f'cart:{cart_id}'
+        pipe = self.redis.pipeline()
+        if quantity > 0:
+            pipe.hset(key, product_id, quantity)
+        else:
+            pipe.hdel(key, product_id)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def clear(self, cart_id):
+        self.redis.delete(f'cart:{cart_id}')
+
+    def purge(self, older_than):
+        return 0
+
+
+def make_cart_store(config):
+    backend = config['CART_BACKEND']
+    if backend == 'redis':
+        return RedisCartStore(config['REDIS_URL'], config['CART_TTL_DAYS'])
+    if backend == 'memory':
+        return MemoryCartStore()
+    return SqlCartStore()
+
+
+cart_store = make_cart_store(app.config)
+
+
+def get_cart_id(create=False):
+    """Opaque cart id from the session, moving an old cookie cart into the store"""
+    cart_id = session.get('cart_id')
+    if cart_id is None and (create or session.get('cart')):
+        cart_id = session['cart_id'] = secrets.token_hex(16)
+
+    legacy_cart = session.pop('cart', None)
+    if legacy_cart:
+        for item in legacy_cart:
+            cart_store.set(cart_id, item['product_id'], item['quantity'])
+        session['cart_count'] = len(legacy_cart)
+    return cart_id
+
+
+def cart_quantities():
+    """{product_id: quantity} for the current visitor"""
+    cart_id = get_cart_id()
+    return cart_store.items(cart_id) if cart_id else {}
+
+
+def cart_lines(quantities=None):
+    """Cart lines priced from the catalog - products that no longer exist are dropped"""
+    if quantities is None:
+        quantities = cart_quantities()
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = catalog_cache.get(product_id)
+        if product:
+            lines.append({
+                'product_id': product_id,
+                'name_en': product.name_en,
+                'name_hi': product.name_hi,
+                'price': product.price,
+                'quantity': quantity,
+                'image_url': product.image_url,
+            })
+    return lines
+
+
+def set_cart_quantity(product_id, quantity):
+    """Hold stock for one cart line and store it
+
+    Returns the new badge count, or None when there is not enough
+    unreserved stock to hold.
+    """
+    cart_id = get_cart_id(create=True)
+    if not hold_stock(cart_id, product_id, quantity):
+        return None
+    cart_store.set(cart_id, product_id, quantity)
+    session['cart_count'] = len(cart_store.items(cart_id))
+    return session['cart_count']
+
+
+def clear_cart():
+    cart_id = session.get('cart_id')
+    if cart_id:
+        cart_store.clear(cart_id)
+    session['cart_count'] = 0
+
+
+# ==================== STOCK RESERVATIONS ====================
+
+def take_holds(cart_id, product_id=None):
+    """Delete a cart's holds and return {product_id: quantity} actually removed
+
+    DELETE ... RETURNING means a hold is only ever released once, even
+    when the expiry sweeper runs at the same moment.
+    """
+    query = db.delete(Reservation).where(Reservation.cart_id == cart_id)
+    if product_id is not None:
+        query = query.where(Reservation.product_id == product_id)
+    rows = db.session.execute(query.returning(Reservation.product_id, Reservation.quantity)).all()
+
+    held = {}
+    for held_product_id, quantity in rows:
+        held[held_product_id] = held.get(held_product_id, 0) + quantity
+    return held
+
+
+def release_holds(quantities):
+    """Give held quantities back to available stock with one UPDATE"""
+    if not quantities:
+        return
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id.in_(quantities))
+        .values(reserved=Product.reserved - db.case(quantities, value=Product.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def hold_stock(cart_id, product_id, quantity):
+    """Set the cart's hold on a product to `quantity` and commit
+
+    Only the difference to the previous hold has to fit into unreserved
+    stock (stock - reserved). Returns False, leaving the old hold in place,
+    when it does not.
+    """
+    previous = take_holds(cart_id, product_id).get(product_id, 0)
+    delta = quantity - previous
+
+    if delta > 0:
+        result = db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id, Product.stock - Product.reserved >= delta)
+            .values(reserved=Product.reserved + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            return False
+    elif delta < 0:
+        release_holds({product_id: -delta})
+
+    if quantity > 0:
+        ttl = timedelta(minutes=app.config['RESERVATION_TTL_MINUTES'])
+        db.session.add(Reservation(cart_id=cart_id, product_id=product_id, quantity=quantity,
+                                   expires_at=datetime.utcnow() + ttl))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same cart changed this line in a parallel request
+        db.session.rollback()
+        return False
+    return True
+
+
+def extend_holds(cart_id):
+    """Push back the expiry of every hold of a cart, e.g. while checking out"""
+    ttl = timedelta(minutes=app.config['RESERVATION_TTL_MINUTES'])
+    db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.cart_id == cart_id)
+        .values(expires_at=datetime.utcnow() + ttl)
+    )
+    db.session.commit()
+
+
+def sweep_expired_reservations(batch_size=500):
+    """Release expired holds in batches, one transaction per batch"""
+    released_total = 0
+    while True:
+        expired = (db.select(Reservation.id)
+                   .where(Reservation.expires_at < datetime.utcnow())
+                   .limit(batch_size))
+        rows = db.session.execute(
+            db.delete(Reservation)
+            .where(Reservation.id.in_(expired))
+            .returning(Reservation.product_id, Reservation.quantity)
+        ).all()
+        if not rows:
+            db.session.commit()
+            return released_total
+
+        released = {}
+        for product_id, quantity in rows:
+            released[product_id] = released.get(product_id, 0) + quantity
+        release_holds(released)
+        db.session.commit()
+        released_total += len(rows)
+
+
+@app.cli.command('sweep-reservations')
+@click.option('--every', type=float, default=0, help='Keep running, sweeping every N seconds.')
+@click.option('--batch-size', type=int, default=500)
+def sweep_reservations_command(every, batch_size):
+    """Release stock held by carts whose reservation expired."""
+    while True:
+        released = sweep_expired_reservations(batch_size)
+        if released or not every:
+            print(f"✅ Released {released} expired reservations")
+        if not every:
+            break
+        time.sleep(every)
+
+
+@app.cli.command('purge-carts')
+def purge_carts_command():
+    """Delete server-side carts idle for longer than CART_TTL_DAYS."""
+    cutoff = datetime.utcnow() - timedelta(days=app.config['CART_TTL_DAYS'])
+    print(f"✅ Purged {cart_store.purge(cutoff)} cart lines")
+
+
+# ==================== INVENTORY LEDGER ====================
+
+def stock_movement(kind, product_id, change, order_id=None):
+    return {'product_id': product_id, 'change': change, 'kind': kind,
+            'order_id': order_id, 'created_at': datetime.utcnow()}
+
+
+def record_stock_movements(movements):
+    """Append ledger rows in the current transaction with one executemany"""
+    movements = [movement for movement in movements if movement['change']]
+    if movements:
+        db.session.execute(db.insert(StockMovement), movements)
+
+
+def order_movements(kind, orders, sign):
+    """One ledger row per order line, e.g. sign=+1 to put rejected items back"""
+    return [stock_movement(kind, item.product_id, sign * item.quantity, order.id)
+            for order in orders for item in order.items]
+
+
+def take_stock_snapshot():
+    """Snapshot every product's ledger total, reading only movements since the last snapshot"""
+    last_id = db.session.execute(db.select(db.func.max(StockMovement.id))).scalar() or 0
+    latest = (db.select(StockSnapshot.product_id, db.func.max(StockSnapshot.id).label('id'))
+              .group_by(StockSnapshot.product_id).subquery())
+    previous = {
+        snapshot.product_id: snapshot
+        for snapshot in StockSnapshot.query.join(latest, StockSnapshot.id == latest.c.id)
+    }
+
+    totals = {product_id: snapshot.stock for product_id, snapshot in previous.items()}
+    since = min((snapshot.last_movement_id for snapshot in previous.values()), default=0)
+    rows = db.session.execute(
+        db.select(StockMovement.product_id, StockMovement.id, StockMovement.change)
+        .where(StockMovement.id > since, StockMovement.id <= last_id)
+        .execution_options(yield_per=5000)
+    )
+    for product_id, movement_id, change in rows:
+        snapshot = previous.get(product_id)
+        if snapshot is None or movement_id > snapshot.last_movement_id:
+            totals[product_id] = totals.get(product_id, 0) + change
+
+    if totals:
+        now = datetime.utcnow()
+        db.session.execute(db.insert(StockSnapshot), [
+            {'product_id': product_id, 'stock': stock, 'last_movement_id': last_id, 'taken_at': now}
+            for product_id, stock in totals.items()
+        ])
+    return len(totals)
+
+
+def stock_at(product_id, when):
+    """Stock of a product at a point in time: nearest snapshot plus the movements after it"""
+    snapshot = (StockSnapshot.query
+                .filter(StockSnapshot.product_id == product_id, StockSnapshot.taken_at <= when)
+                .order_by(StockSnapshot.taken_at.desc()).first())
+    base, after_id = (snapshot.stock, snapshot.last_movement_id) if snapshot else (0, 0)
+    change = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(StockMovement.change), 0))
+        .where(StockMovement.product_id == product_id, StockMovement.id > after_id,
+               StockMovement.created_at <= when)
+    ).scalar()
+    return base + change
+
+
+def reconcile_stock():
+    """Stream the whole ledger and return {product_id: (ledger_total, stock)} for mismatches"""
+    totals = {}
+    rows = db.session.execute(
+        db.select(StockMovement.product_id, StockMovement.change).execution_options(yield_per=5000)
+    )
+    for product_id, change in rows:
+        totals[product_id] = totals.get(product_id, 0) + change
+
+    mismatches = {}
+    for product_id, stock in db.session.execute(db.select(Product.id, Product.stock)):
+        if totals.get(product_id, 0) != stock:
+            mismatches[product_id] = (totals.get(product_id, 0), stock)
+    return mismatches
+
+
+@app.cli.command('snapshot-stock')
+def snapshot_stock_command():
+    """Write a stock snapshot row per product from the ledger."""
+    count = take_stock_snapshot()
+    db.session.commit()
+    print(f"✅ Snapshot taken for {count} products")
+
+
+@app.cli.command('reconcile-stock')
+def reconcile_stock_command():
+    """Verify Product.stock against the stock ledger."""
+    mismatches = reconcile_stock()
+    for product_id, (ledger, stock) in sorted(mismatches.items()):
+        print(f"❌ Product {product_id}: ledger {ledger}, stock {stock}")
+    if mismatches:
+        sys.exit(1)
+    print("✅ Stock matches the ledger")
+
+
+# ==================== NOTIFICATIONS ====================
+
+NOTIFICATION_TEXT = {
+    'placed': 'ऑर्डर प्राप्त हुआ / Order {order_id} received, total ₹{total:.0f}. Thank you, {name}!',
+    'accepted': 'ऑर्डर स्वीकार / Order {order_id} accepted and will be delivered soon.',
+    'rejected': 'ऑर्डर अस्वीकार / Order {order_id} could not be fulfilled. {notes}',
+    'delivered': 'ऑर्डर डिलीवर / Order {order_id} delivered. Thank you for choosing HimGaon Dairy!',
+}
+
+
+def queue_notifications(event, orders, notes=None):
+    """Write outbox rows for the customers of orders in the current transaction
+
+    Nothing is sent here - the notify-worker picks the rows up after commit,
+    so checkout never waits on a mail or SMS gateway and a rolled back order
+    never announces itself.
+    """
+    dairy = app.config['DAIRY_NOTIFY_EMAIL']
+    now = datetime.utcnow()
+    rows = []
+    for order in orders:
+        body = NOTIFICATION_TEXT[event].format(order_id=order.order_id, total=order.total_amount,
+                                               name=order.customer_name, notes=notes or order.admin_notes or '')
+        recipients = [('email', order.email), ('sms', order.phone)]
+        if event == 'placed' and dairy:
+            recipients.append(('email', dairy))
+        rows += [{'event': event, 'order_id': order.order_id, 'channel': channel, 'recipient': recipient,
+                  'body': body, 'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+                 for channel, recipient in recipients if recipient]
+    if rows:
+        db.session.execute(db.insert(OutboxMessage), rows)
+
+
+def mask_recipient(recipient):
+    """a***@example.com / ******3210 - enough to tell messages apart in a log"""
+    name, at, domain = recipient.partition('@')
+    if at:
+        return f'{name[:1]}***@{domain}'
+    return '*' * max(len(recipient) - 4, 0) + recipient[-4:]
+
+
+class StdoutTransport:
+    """Prints messages - the local stand-in for a mail/SMS gateway
+
+    Recipients are masked since stdout usually ends up in shared logs.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            print(f"[{message['channel']} -> {mask_recipient(message['recipient'])}] {message['body']}",
+                  file=self.stream, flush=True)
+
+
+class FileTransport:
+    """Appends one JSON line per message, handy for checking what tests sent"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock, open(self.path, 'a', encoding='utf-8') as out:
+            out.write(json.dumps(message, ensure_ascii=False) + '\n')
+
+
+def make_transport(config):
+    """Build the transport named by NOTIFY_TRANSPORT
+
+    Besides the built-in 'stdout' and 'file:<path>', a real gateway is
+    plugged in as 'package.module:factory' (or 'package.module.factory'):
+    the factory is called with the app config and returns any object with
+    a send(message) method that raises on failure.
+    """
+    setting = config['NOTIFY_TRANSPORT']
+    if setting == 'stdout':
+        return StdoutTransport()
+    if setting.startswith('file:'):
+        return FileTransport(setting[len('file:'):])
+    module_name, _, factory = setting.partition(':') if ':' in setting else setting.rpartition('.')
+    if not module_name or not factory:
+        raise ValueError(f'NOTIFY_TRANSPORT {setting!r} is not stdout, file:<path> or module:factory')
+    return getattr(importlib.import_module(module_name), factory)(config)
+
+
+def claim_outbox_batch(batch_size, lease_seconds=300):
+    """Lease due messages to this worker by pushing their next attempt past the lease
+
+    Rows locked by another worker are skipped on Postgres, and the conditional
+    UPDATE keeps two workers from claiming the same row on SQLite.
+    """
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        db.select(OutboxMessage.id, OutboxMessage.next_attempt_at)
+        .where(OutboxMessage.sent_at.is_(None), OutboxMessage.next_attempt_at <= now)
+        .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    lease_until = now + timedelta(seconds=lease_seconds)
+    claimed = []
+    for message_id, due in candidates:
+        result = db.session.execute(
+            db.update(OutboxMessage)
+            .where(OutboxMessage.id == message_id, OutboxMessage.next_attempt_at == due)
+            .values(next_attempt_at=lease_until)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed.append(message_id)
+
+    messages = []
+    if claimed:
+        columns = (OutboxMessage.id, OutboxMessage.event, OutboxMessage.order_id, OutboxMessage.channel,
+                   OutboxMessage.recipient, OutboxMessage.body, OutboxMessage.attempts)
+        messages = [row._asdict() for row in db.session.execute(
+            db.select(*columns).where(OutboxMessage.id.in_(claimed)))]
+    db.session.commit()
+    return messages
+
+
+def drain_outbox(transport, batch_size=100, threads=4):
+    """Send one batch of due messages on a thread pool and record the outcome
+
+    Failures are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS,
+    after which the message keeps its last_error and stays unsent for a
+    human to look at. Returns (sent, failed).
+    """
+    messages = claim_outbox_batch(batch_size)
+    if not messages:
+        return 0, 0
+
+    def send(message):
+        try:
+            transport.send(message)
+            return message, None
+        except Exception as e:
+            return message, f'{type(e).__name__}: {e}'[:500]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(send, messages))
+
+    now = datetime.utcnow()
+    sent = [message['id'] for message, error in outcomes if error is None]
+    if sent:
+        db.session.execute(
+            db.update(OutboxMessage).where(OutboxMessage.id.in_(sent))
+            .values(sent_at=now, attempts=OutboxMessage.attempts + 1, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    failed = [(message, error) for message, error in outcomes if error is not None]
+    for message, error in failed:
+        attempts = message['attempts'] + 1
+        if attempts >= app.config['OUTBOX_MAX_ATTEMPTS']:
+            retry_at = datetime.max
+        else:
+            retry_at = now + timedelta(seconds=app.config['OUTBOX_RETRY_SECONDS'] * 2 ** (attempts - 1))
+        db.session.execute(
+            db.update(OutboxMessage).where(OutboxMessage.id == message['id'])
+            .values(attempts=attempts, next_attempt_at=retry_at, last_error=error)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return len(sent), len(failed)
+
+
+def outbox_stats():
+    """Pending, given-up and sent message counts"""
+    pending, dead, sent = db.session.execute(db.select(
+        db.func.count().filter(OutboxMessage.sent_at.is_(None),
+                               OutboxMessage.attempts < app.config['OUTBOX_MAX_ATTEMPTS']),
+        db.func.count().filter(OutboxMessage.sent_at.is_(None),
+                               OutboxMessage.attempts >= app.config['OUTBOX_MAX_ATTEMPTS']),
+        db.func.count(OutboxMessage.sent_at),
+    )).one()
+    return {'pending': pending, 'given_up': dead, 'sent': sent}
+
+
+@app.cli.command('notify-worker')
+@click.option('--every', type=float, default=0, help='Keep running, polling every N seconds.')
+@click.option('--batch-size', type=int, default=100)
+@click.option('--threads', type=int, default=4, help='Messages sent in parallel.')
+def notify_worker_command(every, batch_size, threads):
+    """Send queued order notifications."""
+    try:
+        transport = make_transport(app.config)
+    except (ImportError, AttributeError, ValueError) as e:
+        print(f"❌ Invalid NOTIFY_TRANSPORT: {e}")
+        sys.exit(1)
+    while True:
+        sent, failed = drain_outbox(transport, batch_size, threads)
+        if sent or failed or not every:
+            print(f"✅ Sent {sent} notifications, {failed} failed")
+        if sent == batch_size:
+            continue
+        if not every:
+            break
+        time.sleep(every)
+
 
 # ==================== HELPER FUNCTIONS ====================
 
-def generate_unique_order_id():
-    """Generate unique order ID like HGD2025001"""
+class OrderIdAllocator:
+    """Hands out order IDs like HGD2025001 from the order_sequences table
+
+    Each worker reserves a block of numbers with one atomic increment in its
+    own transaction and serves checkouts from memory until the block runs
+    out. A rolled back checkout only leaves a gap, never a duplicate. The
+    counter restarts at 1 every year and grows past 999 (HGD20251000).
+    """
+
     prefix = "HGD"  # HimGaon Dairy
-    year = datetime.now().year
 
-    last_order = Order.query.order_by(Order.id.desc()).first()
+    def __init__(self, block_size=1):
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def next_id(self, year=None):
+        year = year or datetime.now().year
+
+        with self._lock:
+            # A forked gunicorn worker must not reuse its parent's block
+            if self._pid != os.getpid():
+                self._blocks = {}
+                self._pid = os.getpid()
+
+            block = self._blocks.get(year)
+            if not block or block[0] > block[1]:
+                last = self._reserve_block(year, self.block_size)
+                block = self._blocks[year] = [last - self.block_size + 1, last]
+
+            number = block[0]
+            block[0] += 1
+
+        return f"{self.prefix}{year}{number:03d}"
+
+    def reserve(self, count, year=None):
+        """Reserve `count` consecutive order IDs in one round trip, for batch jobs"""
+        year = year or datetime.now().year
+        last = self._reserve_block(year, count)
+        return [f"{self.prefix}{year}{number:03d}" for number in range(last - count + 1, last + 1)]
+
+    def _reserve_block(self, year, size):
+        """Advance the counter row by size and return the new last value"""
+        table = OrderSequence.__table__
+        advance = (
+            db.update(table)
+            .where(table.c.year == year)
+            .values(last_value=table.c.last_value + size)
+        )
+
+        with db.engine.begin() as conn:
+            if conn.execute(advance).rowcount == 0:
+                start = self._last_issued(conn, year)
+                try:
+                    with conn.begin_nested():
+                        conn.execute(db.insert(table).values(year=year, last_value=start + size))
+                except IntegrityError:
+                    # Another worker created this year's row first
+                    conn.execute(advance)
+
+            return conn.execute(
+                db.select(table.c.last_value).where(table.c.year == year)
+            ).scalar_one()
+
+    def _last_issued(self, conn, year):
+        """Highest number already used this year, for databases older than the counter table"""
+        prefix = f"{self.prefix}{year}"
+        order_ids = Order.__table__.c.order_id
+        last_order_id = conn.execute(
+            db.select(order_ids)
+            .where(order_ids.like(f"{prefix}%"))
+            .order_by(db.func.length(order_ids).desc(), order_ids.desc())
+            .limit(1)
+        ).scalar()
 
-    if last_order and last_order.order_id:
         try:
-            last_num = int(last_order.order_id[-3:])
-            new_num = last_num + 1
-        except:
-            new_num = 1
+            return int(last_order_id[len(prefix):])
+        except (TypeError, ValueError):
+            return 0
+
+
+order_id_allocator = OrderIdAllocator(block_size=app.config['ORDER_ID_BLOCK_SIZE'])
+
+
+def generate_unique_order_id():
+    """Generate unique order ID like HGD2025001"""
+    return order_id_allocator.next_id()
+
+
+def placed_order_for_token(token):
+    """order_id already placed with this checkout token, or None"""
+    return db.session.execute(
+        db.select(Order.order_id)
+        .join(CheckoutToken, CheckoutToken.order_id == Order.id)
+        .where(CheckoutToken.token == token, CheckoutToken.expires_at > datetime.utcnow())
+    ).scalar()
+
+
+def sweep_checkout_tokens(batch_size=1000):
+    """Delete expired checkout tokens in batches, one transaction per batch"""
+    deleted_total = 0
+    while True:
+        expired = (db.select(CheckoutToken.token)
+                   .where(CheckoutToken.expires_at < datetime.utcnow())
+                   .limit(batch_size))
+        deleted = db.session.execute(
+            db.delete(CheckoutToken).where(CheckoutToken.token.in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if not deleted:
+            return deleted_total
+        deleted_total += deleted
+
+
+@app.cli.command('sweep-checkout-tokens')
+@click.option('--batch-size', type=int, default=1000)
+def sweep_checkout_tokens_command(batch_size):
+    """Delete expired checkout tokens (run daily)."""
+    print(f"✅ Deleted {sweep_checkout_tokens(batch_size)} expired checkout tokens")
+
+
+def load_cart_products(product_ids):
+    """Load every product referenced by the cart in a single query"""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    return {product.id: product for product in products}
+
+
+def reserve_stock(quantities, held=None):
+    """Decrement stock for {product_id: quantity} with conditional UPDATEs
+
+    Each row is only touched when enough unreserved stock is left, so two
+    workers can never sell the same litre twice. `held` are the caller's
+    own cart holds (already taken with take_holds), which are converted
+    into the sale. Rows are updated in id order to keep Postgres row locks
+    ordered. Returns the product ids that could not be reserved; the
+    caller must roll back when the list is not empty.
+    """
+    held = held or {}
+    failed = []
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        own = held.get(product_id, 0)
+        result = db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id, Product.stock - Product.reserved + own >= quantity)
+            .values(stock=Product.stock - quantity, reserved=Product.reserved - own)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            failed.append(product_id)
+    return failed
+
+
+def restock(quantities):
+    """Return {product_id: quantity} to stock with one set-based UPDATE"""
+    if not quantities:
+        return
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id.in_(quantities))
+        .values(stock=Product.stock + db.case(quantities, value=Product.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def order_quantities(orders):
+    """Total quantity per product across the items of the given orders"""
+    quantities = {}
+    for order in orders:
+        for item in order.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements executed inside the block
+
+        with count_queries() as statements:
+            client.get('/admin/orders/1')
+        assert len(statements) <= 3
+
+    Lets a check fail as soon as a route starts issuing one query per row.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def encode_order_cursor(order):
+    """Keyset cursor for an order - its (order_date, id) position"""
+    return f"{order.order_date.isoformat()}~{order.id}"
+
+
+def decode_order_cursor(cursor):
+    """Parse a cursor from encode_order_cursor, None when missing or invalid"""
+    try:
+        order_date, order_id = cursor.rsplit('~', 1)
+        return datetime.fromisoformat(order_date), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search_orders(query, search):
+    """Narrow an order query by Order ID, phone or customer name prefix
+
+    The kind of search is picked from the text itself so each lookup hits
+    a single index: HGD... is an Order ID, digits are a phone number and
+    anything else is a name. Prefixes are matched as a range rather than
+    LIKE, which neither SQLite nor Postgres will serve from a plain index.
+    Names are compared lowercased, against ix_orders_customer_name_lower.
+    """
+    search = search.strip()
+    if not search:
+        return query
+    if search.upper().startswith(OrderIdAllocator.prefix):
+        column, search = Order.order_id, search.upper()
+    elif search.lstrip('+').isdigit():
+        column = Order.phone
+    else:
+        column, search = db.func.lower(Order.customer_name), search.lower()
+    return query.filter(column >= search, column < search + '\uffff')
+
+
+def paginate_orders(query, after=None, before=None, per_page=50):
+    """Seek one page of orders newest first on (order_date, id)
+
+    `after` continues to older orders, `before` steps back to newer ones.
+    Every page is a bounded index range scan, so its cost does not depend
+    on how many orders exist. Returns (orders, older_cursor, newer_cursor).
+    """
+    position = db.tuple_(Order.order_date, Order.id)
+    after, before = decode_order_cursor(after), decode_order_cursor(before)
+
+    if before:
+        rows = (query.filter(position > db.tuple_(*before))
+                .order_by(Order.order_date.asc(), Order.id.asc())
+                .limit(per_page + 1).all())
+        has_newer = len(rows) > per_page
+        orders = list(reversed(rows[:per_page]))
+        has_older = True
     else:
-        new_num = 1
+        if after:
+            query = query.filter(position < db.tuple_(*after))
+        rows = (query.order_by(Order.order_date.desc(), Order.id.desc())
+                .limit(per_page + 1).all())
+        has_older = len(rows) > per_page
+        orders = rows[:per_page]
+        has_newer = after is not None
 
-    return f"{prefix}{year}{new_num:03d}"
+    older = encode_order_cursor(orders[-1]) if orders and has_older else None
+    newer = encode_order_cursor(orders[0]) if orders and has_newer else None
+    return orders, older, newer
 
 
 def admin_required(f):
@@ -117,14 +2084,940 @@ def admin_required(f):
     return decorated_function
 
 
+# ==================== SALES REPORTS ====================
+
+def record_product_sales(lines, sign=1):
+    """Add (day, product_id, quantity, revenue) lines to the rollup, sign=-1 takes them back out
+
+    One set-based UPDATE per day covers every product of that day, so the
+    number of statements does not grow with the number of order lines.
+    Rows the UPDATE did not find are inserted afterwards.
+    """
+    days = {}
+    for day, product_id, quantity, revenue in lines:
+        totals = days.setdefault(day, {})
+        quantity_total, revenue_total = totals.get(product_id, (0, 0.0))
+        totals[product_id] = (quantity_total + sign * quantity, revenue_total + sign * revenue)
+
+    for day, totals in days.items():
+        pending = list(totals)
+        while pending:
+            increment = (
+                db.update(DailyProductSales)
+                .where(DailyProductSales.day == day, DailyProductSales.product_id.in_(pending))
+                .values(quantity=DailyProductSales.quantity + db.case(
+                            {pid: totals[pid][0] for pid in pending}, value=DailyProductSales.product_id, else_=0),
+                        revenue=DailyProductSales.revenue + db.case(
+                            {pid: totals[pid][1] for pid in pending}, value=DailyProductSales.product_id, else_=0.0))
+                .returning(DailyProductSales.product_id)
+                .execution_options(synchronize_session=False)
+            )
+            updated = set(db.session.scalars(increment))
+            pending = [pid for pid in pending if pid not in updated]
+            if not pending:
+                break
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(DailyProductSales), [
+                        {'day': day, 'product_id': pid, 'quantity': totals[pid][0], 'revenue': totals[pid][1],
+                         'category': getattr(catalog_cache.get(pid), 'category', None)}
+                        for pid in pending])
+                break
+            except IntegrityError:
+                # Another checkout created some of these rows first - add to those and retry the rest
+                continue
+
+
+def order_sales_lines(orders):
+    """Rollup lines for the items of already loaded orders"""
+    return [(order.order_date.date(), item.product_id, item.quantity, item.price * item.quantity)
+            for order in orders for item in order.items]
+
+
+def backfill_product_sales(chunk_days=31):
+    """Rebuild the rollup from hot and archived orders, one DELETE + INSERT ... SELECT per date chunk
+
+    Each chunk is replaced in its own transaction, so reports never read an
+    emptied rollup and a long history never holds one huge transaction. A
+    checkout that creates a row of the chunk at the same moment makes the
+    INSERT fail; the chunk is then simply rebuilt again, now including that
+    order. Returns the number of chunks processed.
+    """
+    dates = all_orders('order_date')
+    first, last = db.session.execute(
+        db.select(db.func.min(dates.c.order_date), db.func.max(dates.c.order_date))).one()
+    db.session.commit()
+    if first is None:
+        db.session.execute(db.delete(DailyProductSales))
+        db.session.commit()
+        return 0
+
+    chunks = 0
+    start = datetime.combine(first.date(), datetime.min.time())
+    # Run up to today, so rows left behind by removed orders are cleared too
+    last = max(last, datetime.utcnow())
+    while start <= last:
+        end = start + timedelta(days=chunk_days)
+        lines = all_order_lines(start, end)
+        day = db.func.date(lines.c.order_date)
+        aggregated = (
+            db.select(day, lines.c.product_id, db.func.max(Product.category),
+                      db.func.sum(lines.c.quantity), db.func.sum(lines.c.quantity * lines.c.price))
+            .select_from(lines)
+            .outerjoin(Product, Product.id == lines.c.product_id)
+            .where(lines.c.status != 'Rejected')
+            .group_by(day, lines.c.product_id)
+        )
+        # The first chunk also clears anything dated before the oldest order
+        since = start if chunks else datetime.min
+        for attempt in range(3):
+            try:
+                db.session.execute(db.delete(DailyProductSales).where(
+                    DailyProductSales.day >= since.date(), DailyProductSales.day < end.date()))
+                db.session.execute(db.insert(DailyProductSales).from_select(
+                    ['day', 'product_id', 'category', 'quantity', 'revenue'], aggregated))
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == 2:
+                    raise
+        start = end
+        chunks += 1
+    return chunks
+
+
+def sales_report(start, end):
+    """Totals for start..end (dates, inclusive) read only from the rollup tables"""
+    in_range = (DailyProductSales.day >= start, DailyProductSales.day <= end)
+    by_product = db.session.execute(
+        db.select(DailyProductSales.product_id, db.func.sum(DailyProductSales.quantity),
+                  db.func.sum(DailyProductSales.revenue))
+        .where(*in_range).group_by(DailyProductSales.product_id)
+    ).all()
+    by_category = db.session.execute(
+        db.select(DailyProductSales.category, db.func.sum(DailyProductSales.revenue))
+        .where(*in_range).group_by(DailyProductSales.category)
+    ).all()
+    orders = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(OrderStat.orders), 0))
+        .where(OrderStat.day >= start, OrderStat.day <= end, OrderStat.status != 'Rejected')
+    ).scalar()
+
+    revenue = sum(total or 0 for _, _, total in by_product)
+    names = {product.id: product.name_en for product in catalog_cache.products()}
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'orders': orders,
+        'revenue': round(revenue, 2),
+        'average_order_value': round(revenue / orders, 2) if orders else 0.0,
+        'by_category': sorted(({'category': category or 'other', 'revenue': round(total or 0, 2)}
+                               for category, total in by_category), key=lambda row: -row['revenue']),
+        'by_product': sorted(({'product_id': product_id, 'name': names.get(product_id, f'#{product_id}'),
+                               'quantity': quantity, 'revenue': round(total or 0, 2)}
+                              for product_id, quantity, total in by_product), key=lambda row: -row['revenue']),
+    }
+
+
+def report_range():
+    """start/end query args as dates, defaulting to the last 30 days"""
+    end = request.args.get('end')
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else datetime.utcnow().date()
+    start = request.args.get('start')
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else end - timedelta(days=29)
+    return start, end
+
+
+@app.cli.command('backfill-sales')
+@click.option('--chunk-days', type=int, default=31)
+def backfill_sales_command(chunk_days):
+    """Rebuild the daily sales rollup from all orders."""
+    chunks = backfill_product_sales(chunk_days)
+    print(f"✅ Sales rollup rebuilt in {chunks} chunks")
+
+
+# ==================== PRODUCT IMPORT ====================
+
+PRODUCT_FIELDS = ['name_en', 'name_hi', 'price', 'stock', 'description_en', 'description_hi',
+                  'image_url', 'category']
+
+
+def default_sku(product_id):
+    return f"HGD-P{product_id:04d}"
+
+
+def validate_product_fields(fields):
+    """Rules shared by the add-product form and the CSV import - returns an error or None"""
+    if not fields['name_en'] or not fields['name_hi']:
+        return 'नाम आवश्यक / Name (English and Hindi) is required'
+    if fields['price'] <= 0:
+        return 'मूल्य 0 से अधिक / Price must be greater than 0'
+    if fields['stock'] < 0:
+        return 'स्टॉक ऋणात्मक नहीं / Stock cannot be negative'
+    return None
+
+
+def parse_product_row(row, product=None):
+    """Product fields from a CSV row; blank or missing cells keep the existing product's value"""
+    fields = {}
+    for name in PRODUCT_FIELDS:
+        value = (row.get(name) or '').strip()
+        if not value and product is not None:
+            fields[name] = getattr(product, name)
+        elif name == 'price':
+            fields[name] = float(value or 0)
+        elif name == 'stock':
+            fields[name] = int(value or 0)
+        else:
+            fields[name] = value
+    return fields
+
+
+def import_products(lines, batch_size=500):
+    """Upsert products by SKU from CSV text in the current transaction
+
+    Rows are read in batches: one SELECT per batch finds existing SKUs,
+    updates and inserts each go out as one executemany, and stock changes
+    are written to the ledger. Stock is applied as a delta to the locked
+    row so ledger and stock always agree. Invalid rows are skipped and
+    reported as (line number, message). The caller bumps the catalog
+    version and commits once. Returns (created, updated, errors).
+    """
+    reader = csv.DictReader(lines)
+    if 'sku' not in (reader.fieldnames or []):
+        return 0, 0, [(1, 'sku कॉलम आवश्यक / The CSV needs a sku column')]
+
+    created = updated = 0
+    errors = []
+    seen = set()
+    rows = enumerate(reader, start=2)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return created, updated, errors
+
+        skus = [(row.get('sku') or '').strip() for _, row in batch]
+        existing = {product.sku: product for product in
+                    Product.query.filter(Product.sku.in_(skus)).with_for_update()}
+
+        updates, inserts, movements = [], [], []
+        for line_no, row in batch:
+            sku = (row.get('sku') or '').strip()
+            if not sku:
+                errors.append((line_no, 'SKU missing'))
+                continue
+            if sku in seen:
+                errors.append((line_no, f'Duplicate SKU {sku}'))
+                continue
+            seen.add(sku)
+
+            product = existing.get(sku)
+            try:
+                fields = parse_product_row(row, product)
+            except ValueError:
+                errors.append((line_no, 'Price/stock must be numbers'))
+                continue
+            error = validate_product_fields(fields)
+            if error:
+                errors.append((line_no, error))
+                continue
+
+            if product:
+                delta = fields['stock'] - product.stock
+                updates.append({'b_id': product.id, 'b_delta': delta,
+                                **{name: fields[name] for name in PRODUCT_FIELDS if name != 'stock'}})
+                movements.append(stock_movement('adjustment', product.id, delta))
+            else:
+                inserts.append({'sku': sku, **fields})
+
+        if updates:
+            db.session.connection().execute(
+                db.update(Product.__table__)
+                .where(Product.__table__.c.id == db.bindparam('b_id'))
+                .values(stock=Product.__table__.c.stock + db.bindparam('b_delta'),
+                        **{name: db.bindparam(name) for name in PRODUCT_FIELDS if name != 'stock'}),
+                updates,
+            )
+        if inserts:
+            stock_by_sku = {row['sku']: row['stock'] for row in inserts}
+            for product_id, sku in db.session.execute(db.insert(Product).returning(Product.id, Product.sku), inserts):
+                movements.append(stock_movement('opening', product_id, stock_by_sku[sku]))
+        record_stock_movements(movements)
+
+        created += len(inserts)
+        updated += len(updates)
+
+
+@app.cli.command('import-products')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+def import_products_command(csv_file):
+    """Create or update products from a CSV keyed by sku."""
+    created, updated, errors = import_products(csv_file)
+    bump_catalog_version()
+    db.session.commit()
+    for line_no, message in errors:
+        print(f"❌ Line {line_no}: {message}")
+    print(f"✅ {created} created, {updated} updated, {len(errors)} rejected")
+
+
+# ==================== ORDER EXPORT ====================
+
+EXPORT_ORDER_COLUMNS = ['order_id', 'order_date', 'status', 'customer_name', 'email', 'phone',
+                        'address', 'total_amount', 'admin_notes']
+EXPORT_ITEM_COLUMNS = ['product_id', 'product_name_en', 'product_name_hi', 'quantity', 'price']
+
+
+def export_rows(start=None, end=None, status=None, batch_size=1000):
+    """Yield one dict per order line, oldest first, fetched in batches
+
+    Archived orders are included. yield_per streams from a server-side
+    cursor on Postgres, so memory stays flat however many orders match.
+    `end` is inclusive.
+    """
+    def lines(order, item):
+        stmt = (db.select(*(getattr(order, name) for name in EXPORT_ORDER_COLUMNS),
+                          *(getattr(item, name) for name in EXPORT_ITEM_COLUMNS),
+                          order.id.label('order_pk'), item.id.label('item_pk'))
+                .outerjoin(item, item.order_id == order.id))
+        if start:
+            stmt = stmt.where(order.order_date >= start)
+        if end:
+            stmt = stmt.where(order.order_date < end + timedelta(days=1))
+        if status:
+            stmt = stmt.where(order.status == status)
+        return stmt
+
+    rows = db.union_all(lines(Order, OrderItem), lines(ArchivedOrder, ArchivedOrderItem)).subquery()
+    stmt = (db.select(*(rows.c[name] for name in EXPORT_ORDER_COLUMNS + EXPORT_ITEM_COLUMNS))
+            .order_by(rows.c.order_date, rows.c.order_pk, rows.c.item_pk))
+
+    for row in db.session.execute(stmt.execution_options(yield_per=batch_size)).mappings():
+        row = dict(row)
+        if row['order_date']:
+            row['order_date'] = row['order_date'].isoformat()
+        yield row
+
+
+def export_csv(rows, flush_every=500):
+    """CSV text in chunks - the header goes out before the first row is read"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_ORDER_COLUMNS + EXPORT_ITEM_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_jsonl(rows):
+    """One JSON object per order with its lines nested under items"""
+    for _, lines in groupby(rows, key=lambda row: row['order_id']):
+        lines = list(lines)
+        order = {name: lines[0][name] for name in EXPORT_ORDER_COLUMNS}
+        order['items'] = [{name: line[name] for name in EXPORT_ITEM_COLUMNS}
+                          for line in lines if line['product_id'] is not None]
+        yield json.dumps(order, ensure_ascii=False) + '\n'
+
+
+def parse_export_date(value):
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+@app.cli.command('export-orders')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--start', default=None, help='First order date (YYYY-MM-DD).')
+@click.option('--end', default=None, help='Last order date (YYYY-MM-DD), inclusive.')
+@click.option('--status', default=None)
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-')
+def export_orders_command(fmt, start, end, status, output):
+    """Stream orders with their items as CSV or JSON lines."""
+    rows = export_rows(parse_export_date(start), parse_export_date(end), status)
+    for chunk in (export_csv(rows) if fmt == 'csv' else export_jsonl(rows)):
+        output.write(chunk)
+
+
+# ==================== ORDER ARCHIVE ====================
+
+CLOSED_STATUSES = ('Delivered', 'Rejected')
+
+
+def archive_orders(older_than_days=None, batch_size=500):
+    """Move closed orders placed before the cutoff into the archive tables
+
+    Each batch copies orders and items with INSERT ... SELECT and deletes
+    them from the hot tables in one transaction, so an interrupted run
+    never loses or duplicates an order. Dashboard counters and sales
+    rollups are kept as they are, and their rebuilds read the archive
+    too. Returns the number of orders moved.
+    """
+    days = app.config['ARCHIVE_AFTER_DAYS'] if older_than_days is None else older_than_days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    order_columns = [column.name for column in Order.__table__.columns]
+    item_columns = [column.name for column in OrderItem.__table__.columns]
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            db.select(Order.id)
+            .where(Order.status.in_(CLOSED_STATUSES), Order.order_date < cutoff)
+            .order_by(Order.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            db.session.commit()
+            return moved
+
+        now = datetime.utcnow()
+        db.session.execute(db.insert(ArchivedOrder).from_select(
+            order_columns + ['archived_at'],
+            db.select(*(Order.__table__.c[name] for name in order_columns), db.literal(now))
+            .where(Order.id.in_(ids))))
+        db.session.execute(db.insert(ArchivedOrderItem).from_select(
+            item_columns,
+            db.select(*(OrderItem.__table__.c[name] for name in item_columns)).where(OrderItem.order_id.in_(ids))))
+
+        for model in (CheckoutToken, SubscriptionDelivery, OrderItem):
+            db.session.execute(db.delete(model).where(model.order_id.in_(ids))
+                               .execution_options(synchronize_session=False))
+        db.session.execute(db.delete(Order).where(Order.id.in_(ids)).execution_options(synchronize_session=False))
+        db.session.commit()
+        moved += len(ids)
+
+
+def all_orders(*columns):
+    """The named order columns of the hot and archived tables as one UNION ALL subquery"""
+    return db.union_all(
+        db.select(*(Order.__table__.c[name] for name in columns)),
+        db.select(*(ArchivedOrder.__table__.c[name] for name in columns)),
+    ).subquery()
+
+
+def all_order_lines(start, end):
+    """(order_date, status, product_id, quantity, price) of hot and archived order items placed in [start, end)"""
+    def lines(order, item):
+        return (db.select(order.order_date, order.status, item.product_id, item.quantity, item.price)
+                .join(item, item.order_id == order.id)
+                .where(order.order_date >= start, order.order_date < end))
+    return db.union_all(lines(Order, OrderItem), lines(ArchivedOrder, ArchivedOrderItem)).subquery()
+
+
+def find_order(pk=None, **filters):
+    """Order by primary key or filters, falling back to the archive; returns (order, archived)"""
+    for model, archived in ((Order, False), (ArchivedOrder, True)):
+        if pk is not None:
+            order = db.session.get(model, pk, options=[selectinload(model.items)])
+        else:
+            order = model.query.options(selectinload(model.items)).filter_by(**filters).first()
+        if order is not None:
+            return order, archived
+    return None, False
+
+
+@app.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Age in days, defaults to ARCHIVE_AFTER_DAYS.')
+@click.option('--batch-size', type=int, default=500)
+def archive_orders_command(days, batch_size):
+    """Move old delivered/rejected orders into the archive tables."""
+    print(f"✅ Archived {archive_orders(days, batch_size)} orders")
+
+
+# ==================== SUBSCRIPTIONS ====================
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def parse_days(days):
+    """'daily' or 'mon,wed,fri' -> days_mask"""
+    if days.strip().lower() == 'daily':
+        return 127
+    mask = 0
+    for day in days.lower().split(','):
+        mask |= 1 << WEEKDAYS.index(day.strip()[:3])
+    return mask
+
+
+def due_subscriptions(delivery_date):
+    """Active subscriptions due on delivery_date that are not paused or already generated"""
+    paused = db.exists().where(
+        SubscriptionPause.subscription_id == Subscription.id,
+        SubscriptionPause.start_date <= delivery_date,
+        SubscriptionPause.end_date >= delivery_date,
+    )
+    generated = db.exists().where(
+        SubscriptionDelivery.subscription_id == Subscription.id,
+        SubscriptionDelivery.delivery_date == delivery_date,
+    )
+    return (Subscription.query
+            .filter(Subscription.active.is_(True),
+                    Subscription.days_mask.op('&')(1 << delivery_date.weekday()) != 0,
+                    ~paused, ~generated)
+            .order_by(Subscription.id)
+            .all())
+
+
+def generate_subscription_orders(delivery_date):
+    """Create the Order/OrderItem rows of every subscription due on delivery_date
+
+    Subscriptions of the same customer (phone + address) share one order.
+    Stock is taken with one conditional UPDATE per product; subscribers
+    that no longer fit into unreserved stock are skipped and picked up by
+    a re-run. Everything is inserted with executemany in one transaction,
+    and the subscription_deliveries key makes re-runs for the same date
+    a no-op. Returns (orders_created, skipped_subscriptions).
+    """
+    subscriptions = due_subscriptions(delivery_date)
+    products = load_cart_products(sub.product_id for sub in subscriptions)
+
+    available = {pid: product.stock - product.reserved for pid, product in products.items()}
+    taken = {}
+    customers = {}
+    skipped = []
+    for sub in subscriptions:
+        if sub.product_id not in products or taken.get(sub.product_id, 0) + sub.quantity > available[sub.product_id]:
+            skipped.append(sub)
+            continue
+        taken[sub.product_id] = taken.get(sub.product_id, 0) + sub.quantity
+        customers.setdefault((sub.phone, sub.address), []).append(sub)
+
+    if not customers:
+        db.session.rollback()
+        return 0, skipped
+
+    db.session.close()
+    order_ids = order_id_allocator.reserve(len(customers))
+
+    for product_id in sorted(taken):
+        result = db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id, Product.stock - Product.reserved >= taken[product_id])
+            .values(stock=Product.stock - taken[product_id])
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise RuntimeError(f'Stock for product {product_id} changed during generation, re-run')
+
+    now = datetime.utcnow()
+    order_rows = []
+    for order_id, subs in zip(order_ids, customers.values()):
+        first = subs[0]
+        order_rows.append({
+            'order_id': order_id, 'customer_name': first.customer_name, 'email': first.email,
+            'phone': first.phone, 'address': first.address, 'status': 'Pending',
+            'delivery_zone': zone_matcher.match(first.address),
+            'total_amount': sum(products[sub.product_id].price * sub.quantity for sub in subs),
+            'order_date': now, 'updated_at': now,
+            'admin_notes': f'Subscription delivery for {delivery_date.isoformat()}',
+        })
+    inserted = db.session.execute(db.insert(Order).returning(Order.id, Order.order_id), order_rows)
+    pk_by_order_id = {order_id: pk for pk, order_id in inserted}
+
+    item_rows, movements, deliveries = [], [], []
+    for order_id, subs in zip(order_ids, customers.values()):
+        pk = pk_by_order_id[order_id]
+        for sub in subs:
+            product = products[sub.product_id]
+            item_rows.append({
+                'order_id': pk, 'product_id': product.id, 'quantity': sub.quantity, 'price': product.price,
+                'product_name_en': product.name_en, 'product_name_hi': product.name_hi,
+            })
+            movements.append(stock_movement('sale', product.id, -sub.quantity, pk))
+            deliveries.append({'subscription_id': sub.id, 'delivery_date': delivery_date, 'order_id': pk})
+
+    db.session.execute(db.insert(OrderItem), item_rows)
+    record_product_sales((now.date(), row['product_id'], row['quantity'], row['price'] * row['quantity'])
+                         for row in item_rows)
+    db.session.execute(db.insert(SubscriptionDelivery), deliveries)
+    record_stock_movements(movements)
+    record_order_stat(now.date(), 'Pending', len(order_rows), sum(row['total_amount'] for row in order_rows))
+    queue_notifications('placed', [SimpleNamespace(**row) for row in order_rows])
+    bump_catalog_version()
+    return len(order_rows), skipped
+
+
+@app.cli.command('generate-subscriptions')
+@click.option('--date', 'delivery_date', default=None, help='Delivery date (YYYY-MM-DD), defaults to tomorrow.')
+def generate_subscriptions_command(delivery_date):
+    """Create tomorrow's subscription orders - safe to re-run."""
+    if delivery_date:
+        delivery_date = datetime.strptime(delivery_date, '%Y-%m-%d').date()
+    else:
+        delivery_date = datetime.now().date() + timedelta(days=1)
+
+    try:
+        created, skipped = generate_subscription_orders(delivery_date)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        print("❌ Another run is generating this date, try again")
+        sys.exit(1)
+    except RuntimeError as e:
+        db.session.rollback()
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"✅ {created} subscription orders for {delivery_date.isoformat()}")
+    for sub in skipped:
+        print(f"⚠️  Skipped subscription {sub.id} ({sub.phone}) - insufficient stock")
+
+
+@app.cli.command('add-subscription')
+@click.option('--name', required=True)
+@click.option('--email', required=True)
+@click.option('--phone', required=True)
+@click.option('--address', required=True)
+@click.option('--product-id', type=int, required=True)
+@click.option('--quantity', type=int, default=1)
+@click.option('--days', default='daily', help="'daily' or e.g. 'mon,wed,fri'.")
+def add_subscription_command(name, email, phone, address, product_id, quantity, days):
+    """Register a recurring delivery."""
+    subscription = Subscription(customer_name=name, email=email, phone=phone, address=address,
+                                product_id=product_id, quantity=quantity, days_mask=parse_days(days))
+    db.session.add(subscription)
+    db.session.commit()
+    print(f"✅ Subscription {subscription.id} created")
+
+
+@app.cli.command('pause-subscription')
+@click.argument('subscription_id', type=int)
+@click.argument('start')
+@click.argument('end')
+def pause_subscription_command(subscription_id, start, end):
+    """Pause deliveries from START to END (YYYY-MM-DD, inclusive)."""
+    db.session.add(SubscriptionPause(
+        subscription_id=subscription_id,
+        start_date=datetime.strptime(start, '%Y-%m-%d').date(),
+        end_date=datetime.strptime(end, '%Y-%m-%d').date(),
+    ))
+    db.session.commit()
+    print(f"✅ Subscription {subscription_id} paused {start} to {end}")
+
+
+# ==================== DISPATCH ====================
+
+# Seeded by migration 13 - more zones come in with 'flask import-zones'
+DEFAULT_ZONES = [
+    ('262501', 'Pithoragarh', 'pithoragarh,siltham,takana,bhatkot,linthura', 29.5830, 80.2180),
+    ('262524', 'Gangolihat', 'gangolihat,gangolihaat', 29.6550, 80.0410),
+    ('262531', 'Berinag', 'berinag,chaukori', 29.7770, 80.0560),
+    ('262551', 'Didihat', 'didihat,askot', 29.8000, 80.2520),
+    ('262545', 'Dharchula', 'dharchula,jauljibi', 29.8470, 80.5370),
+    ('262554', 'Munsiyari', 'munsiyari,madkot', 30.0670, 80.2380),
+]
+
+PINCODE = re.compile(r'(?<!\d)(\d{3}) ?(\d{3})(?!\d)')
+UNIT_SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*(kg|kilo|g|gm|grams?|ml|l|liters?|litres?|pieces?|pcs)\b', re.I)
+UNITS = {'kg': ('kg', 1), 'kilo': ('kg', 1), 'g': ('kg', 0.001), 'gm': ('kg', 0.001), 'gram': ('kg', 0.001),
+         'grams': ('kg', 0.001), 'ml': ('L', 0.001), 'l': ('L', 1), 'liter': ('L', 1), 'liters': ('L', 1),
+         'litre': ('L', 1), 'litres': ('L', 1), 'piece': ('pcs', 1), 'pieces': ('pcs', 1), 'pcs': ('pcs', 1)}
+
+
+def address_words(address):
+    return ' ' + ' '.join(re.findall(r'[a-z0-9]+', address.lower())) + ' '
+
+
+class ZoneMatcher:
+    """Maps a free-text address to a zone code, re-reading the small zone table every ttl seconds
+
+    A pincode in the address wins; otherwise the longest village alias
+    found in it does. Unmatched addresses get None.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._aliases = None
+        self._loaded_at = 0.0
+
+    def _load(self):
+        aliases = []
+        zones = db.session.execute(db.select(DeliveryZone.code, DeliveryZone.name, DeliveryZone.aliases),
+                                   bind_arguments=primary_bind())
+        for code, name, extra in zones:
+            for alias in [name] + (extra or '').split(','):
+                words = address_words(alias)
+                if words.strip():
+                    aliases.append((words, code))
+        aliases.sort(key=lambda alias: -len(alias[0]))
+        return aliases
+
+    def match(self, address):
+        pincode = PINCODE.search(address or '')
+        if pincode:
+            return pincode.group(1) + pincode.group(2)
+
+        with self._lock:
+            if self._aliases is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._aliases = self._load()
+                self._loaded_at = time.monotonic()
+            aliases = self._aliases
+
+        words = address_words(address or '')
+        return next((code for alias, code in aliases if alias in words), None)
+
+    def invalidate(self):
+        with self._lock:
+            self._aliases = None
+
+
+zone_matcher = ZoneMatcher(ttl=app.config['CATALOG_CACHE_TTL'])
+
+
+def assign_zones(statuses=('Pending', 'Accepted'), batch_size=1000):
+    """(Re)compute delivery_zone for open orders, one executemany per batch"""
+    zone_matcher.invalidate()
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Order.id, Order.address)
+            .where(Order.status.in_(statuses), Order.id > last_id)
+            .order_by(Order.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        db.session.execute(db.update(Order), [{'id': order_id, 'delivery_zone': zone_matcher.match(address)}
+                                              for order_id, address in rows])
+        last_id = rows[-1][0]
+        updated += len(rows)
+
+
+def product_unit(*texts):
+    """(size, unit) of one item from its name/description - '500g' is (0.5, 'kg')"""
+    for text in texts:
+        found = UNIT_SIZE.search(text or '')
+        if found:
+            unit, factor = UNITS[found.group(2).lower()]
+            return float(found.group(1)) * factor, unit
+    return 1.0, 'pcs'
+
+
+def distance_km(a, b):
+    """Great-circle distance between two (lat, lon) points"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 12742 * math.asin(math.sqrt(h))
+
+
+def route_stops(points, depot, time_budget=0.5):
+    """Visiting order for points on a tour from and back to the depot
+
+    Nearest neighbour builds the first tour, then 2-opt reverses segments
+    while that shortens it and the time budget lasts. Distances come from
+    one precomputed table, so a few hundred stops plan well within a second.
+    """
+    places = [depot] + list(points)
+    table = [[distance_km(a, b) for b in places] for a in places]
+
+    tour = [0]
+    left = set(range(1, len(places)))
+    while left:
+        here = table[tour[-1]]
+        nearest = min(left, key=here.__getitem__)
+        tour.append(nearest)
+        left.remove(nearest)
+    tour.append(0)
+
+    deadline = time.perf_counter() + time_budget
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, len(tour) - 2):
+            a, b = tour[i - 1], tour[i]
+            for j in range(i + 1, len(tour) - 1):
+                c, d = tour[j], tour[j + 1]
+                if table[a][c] + table[b][d] < table[a][b] + table[c][d] - 1e-9:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+                    b = tour[i]
+    return [index - 1 for index in tour[1:-1]]
+
+
+def plan_delivery_runs(day=None, capacity=None):
+    """Group Accepted orders into delivery runs with their loading totals
+
+    Each zone is one stop. Stops are routed in one tour from the dairy, and
+    the tour is cut into runs whenever a vehicle's litres + kg would
+    exceed capacity. Zones without coordinates (or orders without a zone)
+    become unrouted runs at the end for the driver to plan by hand.
+    """
+    capacity = capacity or app.config['DELIVERY_RUN_CAPACITY']
+    accepted = [Order.status == 'Accepted']
+    if day:
+        accepted += [Order.order_date >= day, Order.order_date < day + timedelta(days=1)]
+
+    orders = {}
+    for row in db.session.execute(
+        db.select(Order.id, Order.order_id, Order.customer_name, Order.phone, Order.address,
+                  Order.total_amount, Order.delivery_zone)
+        .where(*accepted).order_by(Order.delivery_zone, Order.address)
+    ):
+        orders.setdefault(row.delivery_zone, []).append(row._asdict())
+
+    loads = {}
+    for zone, name, description, quantity in db.session.execute(
+        db.select(Order.delivery_zone, db.func.max(OrderItem.product_name_en), db.func.max(Product.description_en),
+                  db.func.sum(OrderItem.quantity))
+        .select_from(Order)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .where(*accepted)
+        .group_by(Order.delivery_zone, OrderItem.product_id)
+    ):
+        size, unit = product_unit(name, description)
+        load = loads.setdefault(zone, {'L': 0.0, 'kg': 0.0, 'pcs': 0.0})
+        load[unit] += size * quantity
+
+    zones = {zone.code: zone for zone in DeliveryZone.query.filter(DeliveryZone.code.in_(
+        [code for code in orders if code]))}
+    located = [code for code in orders if code in zones and zones[code].lat is not None]
+    depot = (app.config['DEPOT_LAT'], app.config['DEPOT_LON'])
+    tour = [located[i] for i in route_stops([(zones[c].lat, zones[c].lon) for c in located], depot)]
+
+    def stop(code):
+        zone = zones.get(code)
+        return {'zone': code or 'unzoned', 'name': zone.name if zone else (code or 'No zone'),
+                'point': (zone.lat, zone.lon) if zone and zone.lat is not None else None,
+                'orders': orders[code], 'load': loads.get(code, {'L': 0.0, 'kg': 0.0, 'pcs': 0.0})}
+
+    runs, current = [], []
+    for code in tour:
+        weight = loads.get(code, {}).get('L', 0) + loads.get(code, {}).get('kg', 0)
+        if current and sum(s['load']['L'] + s['load']['kg'] for s in current) + weight > capacity:
+            runs.append(current)
+            current = []
+        current.append(stop(code))
+    if current:
+        runs.append(current)
+    runs += [[stop(code)] for code in orders if code not in located]
+
+    planned = []
+    for number, stops in enumerate(runs, 1):
+        points = [depot] + [s['point'] for s in stops if s['point']] + [depot]
+        planned.append({
+            'number': number,
+            'routed': all(s['point'] for s in stops),
+            'stops': stops,
+            'orders': sum(len(s['orders']) for s in stops),
+            'load': {unit: round(sum(s['load'][unit] for s in stops), 2) for unit in ('L', 'kg', 'pcs')},
+            'distance_km': round(sum(distance_km(a, b) for a, b in zip(points, points[1:])), 1),
+        })
+    return planned
+
+
+@app.cli.command('plan-deliveries')
+@click.option('--date', 'day', default=None, help='Only orders placed on this date (YYYY-MM-DD).')
+@click.option('--capacity', type=float, default=None, help='Litres + kg per vehicle run.')
+def plan_deliveries_command(day, capacity):
+    """Print delivery runs for every Accepted order, or those placed on --date."""
+    started = time.perf_counter()
+    runs = plan_delivery_runs(parse_export_date(day) if day else None, capacity)
+    for run in runs:
+        load = run['load']
+        print(f"Run {run['number']}: {run['orders']} orders, {load['L']:g} L, {load['kg']:g} kg, "
+              f"{load['pcs']:g} pcs, {run['distance_km']} km{'' if run['routed'] else ' (unrouted)'}")
+        for stop in run['stops']:
+            print(f"  {stop['zone']} {stop['name']}: " + ', '.join(o['order_id'] for o in stop['orders']))
+    print(f"✅ Planned {len(runs)} runs in {time.perf_counter() - started:.2f}s")
+
+
+@app.cli.command('import-zones')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+def import_zones_command(csv_file):
+    """Add or update delivery zones from a CSV with code,name,lat,lon,aliases."""
+    count = 0
+    try:
+        for row in csv.DictReader(csv_file):
+            zone = db.session.get(DeliveryZone, row['code'].strip()) or DeliveryZone(code=row['code'].strip())
+            zone.name = row['name'].strip()
+            zone.lat = float(row['lat']) if row.get('lat') else None
+            zone.lon = float(row['lon']) if row.get('lon') else None
+            zone.aliases = (row.get('aliases') or '').strip().lower() or None
+            db.session.add(zone)
+            count += 1
+        db.session.flush()
+        reassigned = assign_zones()
+        db.session.commit()
+    except (KeyError, ValueError) as e:
+        db.session.rollback()
+        print(f"❌ Invalid zone file: {e}")
+        sys.exit(1)
+    print(f"✅ Imported {count} zones, re-zoned {reassigned} open orders")
+
+
 # ==================== USER ROUTES ====================
 
 @app.route('/')
+@read_replica
 def index():
     """Homepage"""
-    products = Product.query.all()
     lang = session.get('language', 'en')
-    return render_template('index.html', products=products, lang=lang)
+    version, products = catalog_cache.snapshot()
+    stamp, available = availability_cache.get()
+    etag = page_etag(version, stamp)
+
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    product_grid = fragment_cache.get_or_render(
+        (version, stamp), lang,
+        lambda: render_template('_product_grid.html', products=products, available=available, lang=lang))
+    product_search.sync(version, products)
+    return with_etag(render_template('index.html', product_grid=product_grid, lang=lang,
+                                     categories=product_search.categories()), etag)
+
+
+@app.route('/search')
+@read_replica
+def search():
+    """Product search over English and Hindi names and descriptions"""
+    lang = session.get('language', 'en')
+    query = request.args.get('q', '').strip()[:100]
+    category = request.args.get('category', '').strip()
+    version, products = search_catalog(query, category)
+    stamp, available = availability_cache.get()
+    etag = page_etag(version, stamp, query, category)
+
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    product_grid = Markup(render_template('_product_grid.html', products=products, available=available, lang=lang))
+    return with_etag(render_template('index.html', product_grid=product_grid, lang=lang,
+                                     categories=product_search.categories(), search=query,
+                                     category=category.lower(), result_count=len(products)), etag)
+
+
+@app.route('/api/products')
+@read_replica
+def api_products():
+    """Catalog as JSON, filtered by q and category, one page at a time"""
+    query = request.args.get('q', '').strip()[:100]
+    category = request.args.get('category', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 24, type=int), 1), 100)
+    _, products = search_catalog(query, category)
+    _, available = availability_cache.get()
+
+    start = (page - 1) * per_page
+    return jsonify({
+        'products': [{
+            'id': product.id, 'name_en': product.name_en, 'name_hi': product.name_hi, 'price': product.price,
+            'description_en': product.description_en, 'description_hi': product.description_hi,
+            'image_url': product.image_url, 'category': product.category,
+            'stock': available.get(product.id, product.stock),
+        } for product in products[start:start + per_page]],
+        'page': page,
+        'per_page': per_page,
+        'total': len(products),
+        'pages': -(-len(products) // per_page),
+    })
 
 
 @app.route('/set-language/<lang>')
@@ -138,104 +3031,93 @@ def set_language(lang):
 @app.route('/add-to-cart/<int:product_id>', methods=['POST'])
 def add_to_cart(product_id):
     """Add product to cart"""
-    product = Product.query.get_or_404(product_id)
+    product = catalog_cache.get(product_id) or abort(404)
     quantity = int(request.form.get('quantity', 1))
 
     if quantity > product.stock:
         return jsonify({'success': False, 'message': 'स्टॉक उपलब्ध नहीं / Insufficient stock'}), 400
 
-    if 'cart' not in session:
-        session['cart'] = []
-
-    cart = session['cart']
-    found = False
-
-    for item in cart:
-        if item['product_id'] == product_id:
-            new_quantity = item['quantity'] + quantity
-            if new_quantity > product.stock:
-                return jsonify({'success': False, 'message': 'उपलब्ध स्टॉक से अधिक / Exceeds stock'}), 400
-            item['quantity'] = new_quantity
-            found = True
-            break
-
-    if not found:
-        cart.append({
-            'product_id': product_id,
-            'name_en': product.name_en,
-            'name_hi': product.name_hi,
-            'price': product.price,
-            'quantity': quantity,
-            'image_url': product.image_url
-        })
-
-    session['cart'] = cart
-    session.modified = True
+    cart_id = get_cart_id()
+    new_quantity = quantity + (cart_store.quantity(cart_id, product_id) if cart_id else 0)
+    cart_count = set_cart_quantity(product_id, new_quantity) if new_quantity <= product.stock else None
+    if cart_count is None:
+        return jsonify({'success': False, 'message': 'उपलब्ध स्टॉक से अधिक / Exceeds stock'}), 400
 
-    return jsonify({'success': True, 'message': 'कार्ट में जोड़ा / Added to cart', 'cart_count': len(cart)})
+    return jsonify({'success': True, 'message': 'कार्ट में जोड़ा / Added to cart', 'cart_count': cart_count})
 
 
 @app.route('/cart')
 def cart():
     """Shopping cart"""
-    cart_items = session.get('cart', [])
+    cart_items = cart_lines()
+    etag = page_etag(cart_items)
+
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     total = sum(item['price'] * item['quantity'] for item in cart_items)
     lang = session.get('language', 'en')
-    return render_template('cart.html', cart_items=cart_items, total=total, lang=lang)
+    return with_etag(render_template('cart.html', cart_items=cart_items, total=total, lang=lang), etag)
 
 
 @app.route('/update-cart/<int:product_id>', methods=['POST'])
 def update_cart(product_id):
     """Update cart quantity"""
     quantity = int(request.form.get('quantity', 1))
-    product = Product.query.get_or_404(product_id)
+    product = catalog_cache.get(product_id) or abort(404)
 
     if quantity > product.stock:
         return jsonify({'success': False, 'message': 'उपलब्ध स्टॉक से अधिक / Exceeds stock'}), 400
 
-    cart = session.get('cart', [])
-    for item in cart:
-        if item['product_id'] == product_id:
-            if quantity <= 0:
-                cart.remove(item)
-            else:
-                item['quantity'] = quantity
-            break
-
-    session['cart'] = cart
-    session.modified = True
+    cart_id = get_cart_id()
+    if cart_id and cart_store.quantity(cart_id, product_id):
+        if set_cart_quantity(product_id, max(quantity, 0)) is None:
+            return jsonify({'success': False, 'message': 'उपलब्ध स्टॉक से अधिक / Exceeds stock'}), 400
     return jsonify({'success': True})
 
 
 @app.route('/remove-from-cart/<int:product_id>', methods=['POST'])
 def remove_from_cart(product_id):
     """Remove item from cart"""
-    cart = session.get('cart', [])
-    cart = [item for item in cart if item['product_id'] != product_id]
-    session['cart'] = cart
-    session.modified = True
+    if get_cart_id():
+        set_cart_quantity(product_id, 0)
     return jsonify({'success': True})
 
 
 @app.route('/checkout')
 def checkout():
     """Checkout page"""
-    cart_items = session.get('cart', [])
+    cart_items = cart_lines()
     if not cart_items:
         flash('आपकी कार्ट खाली है / Your cart is empty', 'warning')
         return redirect(url_for('index'))
 
+    # Keep the stock held while the customer types their address
+    extend_holds(session['cart_id'])
+
     total = sum(item['price'] * item['quantity'] for item in cart_items)
     lang = session.get('language', 'en')
-    return render_template('checkout.html', cart_items=cart_items, total=total, lang=lang)
+    response = make_response(render_template('checkout.html', cart_items=cart_items, total=total, lang=lang,
+                                             checkout_token=secrets.token_urlsafe(32)))
+    # Going Back must fetch a fresh token, not resubmit the one of an order already placed
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
 @app.route('/place-order', methods=['POST'])
 def place_order():
     """Place order - Saves to SQL database permanently"""
-    cart_items = session.get('cart', [])
+    # A double-submitted form lands on the order its first submit placed
+    token = request.form.get('checkout_token', '')[:64]
+    if token:
+        placed = placed_order_for_token(token)
+        if placed:
+            return redirect(url_for('order_confirmation', order_unique_id=placed))
 
-    if not cart_items:
+    quantities = cart_quantities()
+
+    if not quantities:
         flash('आपकी कार्ट खाली है / Your cart is empty', 'warning')
         return redirect(url_for('index'))
 
@@ -248,49 +3130,80 @@ def place_order():
         flash('सभी फ़ील्ड आवश्यक हैं / All fields are required', 'danger')
         return redirect(url_for('checkout'))
 
-    total_amount = sum(item['price'] * item['quantity'] for item in cart_items)
+    # Hand the cart read's connection back before the allocator borrows its own
+    db.session.close()
     unique_order_id = generate_unique_order_id()
 
-    order = Order(
-        order_id=unique_order_id,
-        customer_name=customer_name,
-        email=email,
-        phone=phone,
-        address=address,
-        total_amount=total_amount,
-        status='Pending'
-    )
-
     try:
-        db.session.add(order)
-        db.session.flush()
+        products = load_cart_products(quantities)
+        held = take_holds(session['cart_id'])
+        release_holds({pid: qty for pid, qty in held.items() if pid not in quantities})
+        failed = [pid for pid in quantities if pid not in products]
+        failed += reserve_stock({pid: qty for pid, qty in quantities.items() if pid in products}, held)
 
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
-
-            if product.stock < item['quantity']:
-                db.session.rollback()
-                flash(f'{product.name_hi} / {product.name_en} के लिए स्टॉक अपर्याप्त', 'danger')
-                return redirect(url_for('cart'))
+        if failed:
+            db.session.rollback()
+            for product_id in failed:
+                product = products.get(product_id)
+                if product:
+                    flash(f'{product.name_hi} / {product.name_en} के लिए स्टॉक अपर्याप्त', 'danger')
+                else:
+                    flash('उत्पाद उपलब्ध नहीं / A product in your cart is no longer available', 'danger')
+            return redirect(url_for('cart'))
+
+        order = Order(
+            order_id=unique_order_id,
+            order_date=datetime.utcnow(),
+            customer_name=customer_name,
+            email=email,
+            phone=phone,
+            address=address,
+            delivery_zone=zone_matcher.match(address),
+            total_amount=sum(products[pid].price * qty for pid, qty in quantities.items()),
+            status='Pending'
+        )
 
-            order_item = OrderItem(
+        bump_catalog_version()
+        db.session.add(order)
+        db.session.flush()
+        count_new_order(order)
+        queue_notifications('placed', [order])
+        if token:
+            expires_at = order.order_date + timedelta(hours=app.config['CHECKOUT_TOKEN_TTL_HOURS'])
+            db.session.add(CheckoutToken(token=token, order_id=order.id, expires_at=expires_at))
+        record_product_sales((order.order_date.date(), product_id, quantity, products[product_id].price * quantity)
+                             for product_id, quantity in quantities.items())
+
+        record_stock_movements(
+            stock_movement('sale', product_id, -quantity, order.id)
+            for product_id, quantity in quantities.items())
+
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            db.session.add(OrderItem(
                 order_id=order.id,
                 product_id=product.id,
                 product_name_en=product.name_en,
                 product_name_hi=product.name_hi,
-                quantity=item['quantity'],
-                price=item['price']
-            )
-            db.session.add(order_item)
-            product.stock -= item['quantity']
+                quantity=quantity,
+                price=product.price
+            ))
 
         db.session.commit()
-        session['cart'] = []
-        session.modified = True
+        clear_cart()
 
         flash(f'ऑर्डर सफल! Order ID: {unique_order_id}', 'success')
         return redirect(url_for('order_confirmation', order_unique_id=unique_order_id))
 
+    except IntegrityError:
+        # A parallel submit of the same form committed first - show its order instead
+        db.session.rollback()
+        placed = token and placed_order_for_token(token)
+        if placed:
+            return redirect(url_for('order_confirmation', order_unique_id=placed))
+        flash('ऑर्डर त्रुटि / Order error. Please try again.', 'danger')
+        return redirect(url_for('checkout'))
+
     except Exception as e:
         db.session.rollback()
         flash('ऑर्डर त्रुटि / Order error. Please try again.', 'danger')
@@ -300,23 +3213,37 @@ def place_order():
 @app.route('/order-confirmation/<order_unique_id>')
 def order_confirmation(order_unique_id):
     """Order confirmation page"""
-    order = Order.query.filter_by(order_id=order_unique_id).first_or_404()
+    order, _ = find_order(order_id=order_unique_id)
+    if order is None:
+        abort(404)
     lang = session.get('language', 'en')
     return render_template('confirmation.html', order=order, lang=lang)
 
 
 @app.route('/track-order', methods=['GET', 'POST'])
+@read_replica
 def track_order():
     """Track order by Order ID and Phone Number"""
     lang = session.get('language', 'en')
     order = None
 
+    if request.method == 'GET':
+        etag = page_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        return with_etag(render_template('track_order.html', order=order, lang=lang), etag)
+
     if request.method == 'POST':
         order_id = request.form.get('order_id', '').strip().upper()
         phone = request.form.get('phone', '').strip()
 
         if order_id and phone:
-            order = Order.query.filter_by(order_id=order_id, phone=phone).first()
+            order, _ = find_order(order_id=order_id, phone=phone)
+            if not order and g.get('read_replica'):
+                # The replica may not have caught up with an order placed moments ago
+                g.read_replica = False
+                order, _ = find_order(order_id=order_id, phone=phone)
 
             if not order:
                 flash('ऑर्डर नहीं मिला / Order not found. Please check Order ID and Phone Number.', 'danger')
@@ -355,30 +3282,100 @@ def admin_logout():
 
 @app.route('/admin/dashboard')
 @admin_required
+@read_replica
 def admin_dashboard():
     """Admin dashboard"""
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='Pending').count()
-    accepted_orders = Order.query.filter_by(status='Accepted').count()
-    low_stock_products = Product.query.filter(Product.stock < 10).all()
-    recent_orders = Order.query.order_by(Order.order_date.desc()).limit(5).all()
+    products = catalog_cache.products()
+    stats = dashboard_cache.get(load_dashboard_stats)
+    status_totals = stats['status_totals']
 
     return render_template('admin/dashboard.html', 
-                         total_products=total_products,
-                         total_orders=total_orders,
-                         pending_orders=pending_orders,
-                         accepted_orders=accepted_orders,
-                         low_stock_products=low_stock_products,
-                         recent_orders=recent_orders)
+                         total_products=len(products),
+                         total_orders=sum(status_totals.values()),
+                         pending_orders=status_totals.get('Pending', 0),
+                         accepted_orders=status_totals.get('Accepted', 0),
+                         low_stock_products=[p for p in products if p.stock < 10],
+                         recent_orders=stats['recent_orders'],
+                         daily_stats=stats['daily'])
+
+
+@app.route('/admin/cache-stats')
+@admin_required
+def admin_cache_stats():
+    """Catalog and fragment cache hit/miss counters for this worker"""
+    return jsonify({'catalog': catalog_cache.stats(), 'fragments': fragment_cache.stats(),
+                    'outbox': outbox_stats(), 'pools': pool_stats()})
+
+
+@app.route('/admin/reports')
+@admin_required
+@read_replica
+def admin_reports():
+    """Sales report page - reads only the rollup tables"""
+    try:
+        start, end = report_range()
+    except ValueError:
+        flash('अमान्य तारीख / Invalid date, use YYYY-MM-DD', 'danger')
+        return redirect(url_for('admin_reports'))
+    return render_template('admin/reports.html', report=sales_report(start, end))
+
+
+@app.route('/admin/reports/summary.json')
+@admin_required
+@read_replica
+def admin_report_summary():
+    """Revenue, order count, average order value and breakdowns as JSON"""
+    try:
+        start, end = report_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date, use YYYY-MM-DD'}), 400
+    return jsonify(sales_report(start, end))
+
+
+@app.route('/admin/reports/daily.json')
+@admin_required
+@read_replica
+def admin_report_daily():
+    """Sales per product per day as JSON"""
+    try:
+        start, end = report_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date, use YYYY-MM-DD'}), 400
+    rows = (DailyProductSales.query
+            .filter(DailyProductSales.day >= start, DailyProductSales.day <= end)
+            .order_by(DailyProductSales.day, DailyProductSales.product_id))
+    return jsonify([{'day': row.day.isoformat(), 'product_id': row.product_id, 'category': row.category,
+                     'quantity': row.quantity, 'revenue': round(row.revenue, 2)} for row in rows])
+
+
+@app.route('/admin/dispatch')
+@admin_required
+@read_replica
+def admin_dispatch():
+    """Delivery runs for every Accepted order (or those placed on ?date=), grouped by zone"""
+    day = request.args.get('date', '')
+    try:
+        runs = plan_delivery_runs(parse_export_date(day) if day else None)
+    except ValueError:
+        flash('अमान्य तारीख / Invalid date, use YYYY-MM-DD', 'danger')
+        return redirect(url_for('admin_dispatch'))
+    return render_template('admin/dispatch.html', runs=runs, day=day,
+                           capacity=app.config['DELIVERY_RUN_CAPACITY'])
 
 
 @app.route('/admin/products')
 @admin_required
+@read_replica
 def admin_products():
-    """Manage products"""
-    products = Product.query.all()
-    return render_template('admin/products.html', products=products)
+    """Manage products, optionally one category at a time"""
+    category = request.args.get('category', '').strip()
+    query = Product.query.order_by(Product.id)
+    if category:
+        query = query.filter(Product.category == category)
+    categories = db.session.scalars(
+        db.select(Product.category).where(Product.category.isnot(None)).distinct().order_by(Product.category)
+    ).all()
+    return render_template('admin/products.html', products=query.all(), categories=categories, category=category)
 
 
 @app.route('/admin/products/add', methods=['GET', 'POST'])
@@ -394,19 +3391,25 @@ def admin_add_product():
         image_url = request.form.get('image_url', '').strip()
         stock = request.form.get('stock', 0, type=int)
         category = request.form.get('category', '').strip()
+        sku = request.form.get('sku', '').strip()
 
-        if not name_en or not name_hi or price <= 0 or stock < 0:
-            flash('अमान्य इनपुट / Invalid input', 'danger')
+        error = validate_product_fields({'name_en': name_en, 'name_hi': name_hi, 'price': price, 'stock': stock})
+        if error:
+            flash(error, 'danger')
             return redirect(url_for('admin_add_product'))
 
         product = Product(
             name_en=name_en, name_hi=name_hi, price=price,
             description_en=description_en, description_hi=description_hi,
-            image_url=image_url, stock=stock, category=category
+            image_url=image_url, stock=stock, category=category, sku=sku or None
         )
 
         try:
             db.session.add(product)
+            db.session.flush()
+            product.sku = product.sku or default_sku(product.id)
+            record_stock_movements([stock_movement('opening', product.id, stock)])
+            bump_catalog_version()
             db.session.commit()
             flash('उत्पाद जोड़ा गया / Product added successfully', 'success')
             return redirect(url_for('admin_products'))
@@ -424,16 +3427,33 @@ def admin_edit_product(product_id):
     product = Product.query.get_or_404(product_id)
 
     if request.method == 'POST':
+        # The stock the admin saw when the form was loaded, not what is stored now
+        old_stock = request.form.get('original_stock', product.stock, type=int)
+        new_stock = request.form.get('stock', 0, type=int)
         product.name_en = request.form.get('name_en', '').strip()
         product.name_hi = request.form.get('name_hi', '').strip()
         product.price = request.form.get('price', 0, type=float)
         product.description_en = request.form.get('description_en', '').strip()
         product.description_hi = request.form.get('description_hi', '').strip()
         product.image_url = request.form.get('image_url', '').strip()
-        product.stock = request.form.get('stock', 0, type=int)
         product.category = request.form.get('category', '').strip()
+        product.sku = request.form.get('sku', '').strip() or default_sku(product.id)
 
         try:
+            # Only overwrite the stock the form showed, so a sale in between is not lost from the ledger
+            result = db.session.execute(
+                db.update(Product)
+                .where(Product.id == product_id, Product.stock == old_stock)
+                .values(stock=new_stock)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                db.session.rollback()
+                flash('स्टॉक बदल गया / Stock changed while saving, please check and save again', 'warning')
+                return redirect(url_for('admin_edit_product', product_id=product_id))
+
+            record_stock_movements([stock_movement('adjustment', product_id, new_stock - old_stock)])
+            bump_catalog_version()
             db.session.commit()
             flash('उत्पाद अपडेट किया गया / Product updated successfully', 'success')
             return redirect(url_for('admin_products'))
@@ -444,6 +3464,32 @@ def admin_edit_product(product_id):
     return render_template('admin/edit_product.html', product=product)
 
 
+@app.route('/admin/products/import', methods=['GET', 'POST'])
+@admin_required
+def admin_import_products():
+    """Bulk create/update products from a CSV upload"""
+    result = None
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('कृपया CSV फ़ाइल चुनें / Please choose a CSV file', 'danger')
+            return redirect(url_for('admin_import_products'))
+
+        try:
+            created, updated, errors = import_products(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'))
+            if created or updated:
+                bump_catalog_version()
+            db.session.commit()
+            result = {'created': created, 'updated': updated, 'errors': errors}
+            flash(f'{created} जोड़े, {updated} अपडेट / {created} created, {updated} updated', 'success')
+        except Exception:
+            db.session.rollback()
+            flash('त्रुटि / Error importing products', 'danger')
+
+    return render_template('admin/import_products.html', result=result, columns=['sku'] + PRODUCT_FIELDS)
+
+
 @app.route('/admin/products/delete/<int:product_id>', methods=['POST'])
 @admin_required
 def admin_delete_product(product_id):
@@ -452,6 +3498,7 @@ def admin_delete_product(product_id):
 
     try:
         db.session.delete(product)
+        bump_catalog_version()
         db.session.commit()
         flash('उत्पाद हटाया गया / Product deleted successfully', 'success')
     except:
@@ -463,24 +3510,58 @@ def admin_delete_product(product_id):
 
 @app.route('/admin/orders')
 @admin_required
+@read_replica
 def admin_orders():
-    """View all orders"""
+    """View orders one keyset page at a time"""
     status_filter = request.args.get('status', 'all')
+    search = request.args.get('q', '').strip()
+
+    query = Order.query
+    if status_filter != 'all':
+        query = query.filter_by(status=status_filter)
+    query = search_orders(query, search)
+
+    orders, older, newer = paginate_orders(
+        query, after=request.args.get('after'), before=request.args.get('before'))
+
+    return render_template('admin/orders.html', orders=orders, status_filter=status_filter,
+                           search=search, older_cursor=older, newer_cursor=newer)
 
-    if status_filter == 'all':
-        orders = Order.query.order_by(Order.order_date.desc()).all()
+
+@app.route('/admin/orders/export')
+@admin_required
+@read_replica
+def admin_export_orders():
+    """Download orders with their items as CSV or JSON lines"""
+    fmt = request.args.get('format', 'csv')
+    status = request.args.get('status', 'all')
+    try:
+        start = parse_export_date(request.args.get('start'))
+        end = parse_export_date(request.args.get('end'))
+    except ValueError:
+        flash('अमान्य तारीख / Invalid date, use YYYY-MM-DD', 'danger')
+        return redirect(url_for('admin_orders'))
+
+    rows = export_rows(start, end, None if status == 'all' else status)
+    if fmt == 'jsonl':
+        body, mimetype = export_jsonl(rows), 'application/x-ndjson'
     else:
-        orders = Order.query.filter_by(status=status_filter).order_by(Order.order_date.desc()).all()
+        fmt, body, mimetype = 'csv', export_csv(rows), 'text/csv'
 
-    return render_template('admin/orders.html', orders=orders, status_filter=status_filter)
+    filename = f"himgaon-orders-{datetime.utcnow():%Y%m%d-%H%M}.{fmt}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 
 @app.route('/admin/orders/<int:order_id>')
 @admin_required
+@read_replica
 def admin_order_detail(order_id):
     """View order details"""
-    order = Order.query.get_or_404(order_id)
-    return render_template('admin/order_detail.html', order=order)
+    order, archived = find_order(order_id)
+    if order is None:
+        abort(404)
+    return render_template('admin/order_detail.html', order=order, archived=archived)
 
 
 @app.route('/admin/orders/<int:order_id>/accept', methods=['POST'])
@@ -490,11 +3571,13 @@ def admin_accept_order(order_id):
     order = Order.query.get_or_404(order_id)
     admin_notes = request.form.get('admin_notes', '').strip()
 
-    order.status = 'Accepted'
-    order.admin_notes = admin_notes
-    order.updated_at = datetime.utcnow()
-
     try:
+        if not move_order_status(order, 'Accepted', admin_notes=admin_notes):
+            db.session.rollback()
+            flash(f'ऑर्डर पहले ही बदल चुका / Order {order.order_id} was already updated', 'warning')
+            return redirect(url_for('admin_order_detail', order_id=order_id))
+        queue_notifications('accepted', [order])
+
         db.session.commit()
         flash(f'ऑर्डर स्वीकार किया गया / Order {order.order_id} accepted successfully', 'success')
     except:
@@ -508,19 +3591,22 @@ def admin_accept_order(order_id):
 @admin_required
 def admin_reject_order(order_id):
     """Reject order and restore stock"""
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(selectinload(Order.items)).get_or_404(order_id)
     admin_notes = request.form.get('admin_notes', '').strip()
 
     try:
-        for item in order.items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.stock += item.quantity
+        # Flip the status first: only the request whose UPDATE matched restores stock
+        if not move_order_status(order, 'Rejected', admin_notes=admin_notes):
+            db.session.rollback()
+            flash(f'ऑर्डर पहले ही अस्वीकार / Order {order.order_id} is already rejected', 'warning')
+            return redirect(url_for('admin_order_detail', order_id=order_id))
 
-        order.status = 'Rejected'
-        order.admin_notes = admin_notes
-        order.updated_at = datetime.utcnow()
+        restock(order_quantities([order]))
+        record_stock_movements(order_movements('reject_restore', [order], 1))
+        record_product_sales(order_sales_lines([order]), sign=-1)
+        queue_notifications('rejected', [order])
 
+        bump_catalog_version()
         db.session.commit()
         flash(f'ऑर्डर अस्वीकार किया गया / Order {order.order_id} rejected and stock restored', 'warning')
     except:
@@ -536,10 +3622,13 @@ def admin_deliver_order(order_id):
     """Mark order as delivered"""
     order = Order.query.get_or_404(order_id)
 
-    order.status = 'Delivered'
-    order.updated_at = datetime.utcnow()
-
     try:
+        if not move_order_status(order, 'Delivered'):
+            db.session.rollback()
+            flash(f'ऑर्डर पहले ही बदल चुका / Order {order.order_id} was already updated', 'warning')
+            return redirect(url_for('admin_order_detail', order_id=order_id))
+        queue_notifications('delivered', [order])
+
         db.session.commit()
         flash(f'ऑर्डर डिलीवर किया गया / Order {order.order_id} marked as delivered', 'success')
     except:
@@ -549,101 +3638,470 @@ def admin_deliver_order(order_id):
     return redirect(url_for('admin_order_detail', order_id=order_id))
 
 
+# Bulk action -> (status an order must be in, status it moves to)
+BULK_TRANSITIONS = {
+    'accept': ('Pending', 'Accepted'),
+    'reject': ('Pending', 'Rejected'),
+    'deliver': ('Accepted', 'Delivered'),
+}
+
+
+def bulk_transition(order_ids, action, admin_notes=''):
+    """Move many orders to a new status in one transaction
+
+    Orders not in the expected status are skipped and reported. The status
+    is changed first with one guarded UPDATE ... RETURNING, and only the
+    orders it actually moved are restocked, counted and notified, so two
+    concurrent bulk actions never apply the same order twice. Rejected
+    orders have their stock restored with a single UPDATE. Returns one
+    result dict per requested order id.
+    """
+    from_status, to_status = BULK_TRANSITIONS[action]
+    query = Order.query.filter(Order.id.in_(order_ids)).with_for_update()
+    if action == 'reject':
+        query = query.options(selectinload(Order.items))
+    orders = {order.id: order for order in query.all()}
+
+    values = {'status': to_status, 'updated_at': datetime.utcnow()}
+    if admin_notes:
+        values['admin_notes'] = admin_notes
+    candidates = [order.id for order in orders.values() if order.status == from_status]
+    moved = set()
+    if candidates:
+        moved = set(db.session.scalars(
+            db.update(Order)
+            .where(Order.id.in_(candidates), Order.status == from_status)
+            .values(**values)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ))
+
+    results = []
+    eligible = []
+    for order_id in order_ids:
+        order = orders.get(order_id)
+        if order is None:
+            results.append({'id': order_id, 'order_id': None, 'success': False, 'message': 'Order not found'})
+        elif order_id not in moved:
+            status = order.status if order.status != from_status else 'already updated'
+            results.append({'id': order_id, 'order_id': order.order_id, 'success': False,
+                            'message': f'Order is {status}, expected {from_status}'})
+        else:
+            eligible.append(order)
+            results.append({'id': order_id, 'order_id': order.order_id, 'success': True, 'message': to_status})
+
+    if not eligible:
+        return results
+
+    if action == 'reject':
+        restock(order_quantities(eligible))
+        record_stock_movements(order_movements('reject_restore', eligible, 1))
+        record_product_sales(order_sales_lines(eligible), sign=-1)
+        bump_catalog_version()
+    # The orders still carry from_status in memory, which is what the counters move out of
+    move_order_stats(eligible, to_status)
+    queue_notifications(to_status.lower(), eligible, admin_notes)
+    for order in eligible:
+        for name, value in values.items():
+            set_committed_value(order, name, value)
+    return results
+
+
+@app.route('/admin/orders/bulk', methods=['POST'])
+@admin_required
+def admin_bulk_orders():
+    """Accept, reject or deliver many orders at once"""
+    action = request.form.get('action', '')
+    admin_notes = request.form.get('admin_notes', '').strip()
+    order_ids = list(dict.fromkeys(request.form.getlist('order_ids', type=int)))
+    wants_json = request.accept_mimetypes.best == 'application/json'
+
+    if action not in BULK_TRANSITIONS or not order_ids:
+        message = 'कोई ऑर्डर/कार्रवाई नहीं चुनी / Select orders and an action'
+        if wants_json:
+            return jsonify({'success': False, 'message': message}), 400
+        flash(message, 'danger')
+        return redirect(request.referrer or url_for('admin_orders'))
+
+    try:
+        results = bulk_transition(order_ids, action, admin_notes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'success': False, 'message': 'Bulk update failed'}), 500
+        flash('त्रुटि / Error updating orders', 'danger')
+        return redirect(request.referrer or url_for('admin_orders'))
+
+    done = [r for r in results if r['success']]
+    skipped = [r for r in results if not r['success']]
+    if wants_json:
+        return jsonify({'success': True, 'updated': len(done), 'results': results})
+
+    flash(f'{len(done)} ऑर्डर अपडेट / {len(done)} orders moved to {BULK_TRANSITIONS[action][1]}', 'success')
+    if skipped:
+        flash('छोड़े गए / Skipped: ' + ', '.join(
+            f"{r['order_id'] or r['id']} ({r['message']})" for r in skipped), 'warning')
+    return redirect(request.referrer or url_for('admin_orders'))
+
+
+# ==================== SCHEMA MIGRATIONS ====================
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register an upgrade step - steps run once each, in version order"""
+    def register(upgrade):
+        MIGRATIONS.append((version, name, upgrade))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return upgrade
+    return register
+
+
+def create_indexes(*indexes):
+    """Create indexes inside the migration transaction, skipping existing ones"""
+    with warnings.catch_warnings():
+        # SQLite reflection skips ix_orders_customer_name_lower, which is expected
+        warnings.filterwarnings('ignore', 'Skipped unsupported reflection of expression-based index')
+        for index in indexes:
+            index.create(db.session.connection(), checkfirst=True)
+
+
+def create_tables(*models):
+    """Create tables added after migration 1, skipping existing ones"""
+    for model in models:
+        model.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def index_named(model, name):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+@migration(1, 'create tables')
+def _create_tables():
+    # create_all() only adds missing tables, so it is safe on old databases
+    db.metadata.create_all(db.session.connection())
+
+
+@migration(2, 'order list keyset and search indexes')
+def _order_list_indexes():
+    create_indexes(*(index_named(Order, name) for name in (
+        'ix_orders_order_date_id', 'ix_orders_status_order_date_id',
+        'ix_orders_phone',
+    )))
+
+
+@migration(3, 'backfill dashboard counters')
+def _backfill_order_stats():
+    if OrderStat.query.first() is None:
+        rebuild_order_stats()
+
+
+@migration(4, 'hot lookup indexes')
+def _hot_lookup_indexes():
+    create_indexes(
+        index_named(Order, 'ix_orders_order_id_phone'),
+        index_named(OrderItem, 'ix_order_items_order_id'),
+        index_named(Product, 'ix_products_stock'),
+    )
+
+
+@migration(5, 'server-side carts')
+def _cart_items_table():
+    create_tables(CartItem)
+
+
+def add_columns(model, *names):
+    """ALTER TABLE ... ADD COLUMN for model columns the table does not have yet
+
+    New columns must be nullable or carry a server_default so existing rows
+    stay valid.
+    """
+    conn = db.session.connection()
+    table = model.__table__
+    existing = {column['name'] for column in db.inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f'ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(conn.dialect)}'
+        if column.server_default is not None:
+            ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+        conn.execute(db.text(ddl))
+
+
+@migration(6, 'stock reservations')
+def _stock_reservations():
+    add_columns(Product, 'reserved')
+    create_tables(Reservation)
+
+
+@migration(7, 'stock ledger with opening balances')
+def _stock_ledger():
+    create_tables(StockMovement, StockSnapshot)
+    if StockMovement.query.first() is None:
+        record_stock_movements(
+            stock_movement('opening', product_id, stock)
+            for product_id, stock in db.session.execute(db.select(Product.id, Product.stock)))
+
+
+@migration(8, 'subscriptions')
+def _subscriptions():
+    create_tables(Subscription, SubscriptionPause, SubscriptionDelivery)
+
+
+@migration(9, 'product SKUs')
+def _product_skus():
+    add_columns(Product, 'sku')
+    for (product_id,) in db.session.execute(db.select(Product.id).where(Product.sku.is_(None))):
+        db.session.execute(db.update(Product).where(Product.id == product_id).values(sku=default_sku(product_id)))
+    create_indexes(index_named(Product, 'ix_products_sku'))
+
+
+@migration(10, 'daily product sales rollup')
+def _daily_product_sales():
+    create_tables(DailyProductSales)
+    db.session.commit()
+    backfill_product_sales()
+
+
+@migration(11, 'notification outbox')
+def _notification_outbox():
+    create_tables(OutboxMessage)
+
+
+@migration(12, 'checkout idempotency tokens')
+def _checkout_tokens():
+    create_tables(CheckoutToken)
+
+
+@migration(13, 'delivery zones')
+def _delivery_zones():
+    add_columns(Order, 'delivery_zone')
+    create_tables(DeliveryZone)
+    if DeliveryZone.query.first() is None:
+        db.session.execute(db.insert(DeliveryZone), [
+            {'code': code, 'name': name, 'aliases': aliases, 'lat': lat, 'lon': lon}
+            for code, name, aliases, lat, lon in DEFAULT_ZONES])
+    create_indexes(index_named(Order, 'ix_orders_status_delivery_zone'))
+    assign_zones()
+
+
+@migration(14, 'product category index')
+def _product_category_index():
+    create_indexes(index_named(Product, 'ix_products_category'))
+
+
+@migration(15, 'order archive')
+def _order_archive():
+    create_tables(ArchivedOrder, ArchivedOrderItem)
+
+
+@migration(16, 'archived order date index')
+def _archived_order_date_index():
+    create_indexes(index_named(ArchivedOrder, 'ix_archived_orders_order_date'))
+
+
+@migration(17, 'case-insensitive customer name index')
+def _customer_name_lower_index():
+    # checkfirst cannot see expression indexes on SQLite, so let the database skip an existing one
+    db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_orders_customer_name_lower ON orders (lower(customer_name))'))
+    db.session.execute(db.text('DROP INDEX IF EXISTS ix_orders_customer_name'))
+
+
+def upgrade_db():
+    """Apply pending migrations, each in its own transaction"""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    applied = {version for (version,) in db.session.query(SchemaMigration.version)}
+    db.session.rollback()
+
+    for version, name, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            upgrade()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+            print(f"✅ Applied migration {version:03d} {name}")
+        except IntegrityError:
+            # Another worker applied it at the same moment
+            db.session.rollback()
+
+
+def hot_queries():
+    """The lookups that must always be served by an index"""
+    return {
+        'track_order': Order.query.filter_by(order_id='HGD2025001', phone='9999999999'),
+        'admin_orders': (Order.query.filter_by(status='Pending')
+                         .order_by(Order.order_date.desc(), Order.id.desc()).limit(51)),
+        'order_items': OrderItem.query.filter_by(order_id=1),
+        'archived_track_order': ArchivedOrder.query.filter_by(order_id='HGD2025001', phone='9999999999'),
+        'archive_candidates': (Order.query.with_entities(Order.id)
+                               .filter(Order.status == 'Delivered', Order.order_date < datetime(2025, 1, 1))),
+        'low_stock': Product.query.filter(Product.stock < 10),
+        'admin_products_category': Product.query.filter_by(category='milk').order_by(Product.id),
+        'search_order_id': search_orders(Order.query, 'HGD2025'),
+        'search_phone': search_orders(Order.query, '98765'),
+        'search_name': search_orders(Order.query, 'Ramesh'),
+    }
+
+
+def explain_query(query):
+    """Query plan lines for a query on the current database"""
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+    # Tiny tables make Postgres prefer sequential scans, so rule them out first
+    db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    return [row[0] for row in db.session.execute(db.text(f'EXPLAIN {sql}'))]
+
+
+def uses_index(plan):
+    """True when no step of the plan reads a whole table"""
+    for line in plan:
+        if line.startswith('SCAN') and 'USING' not in line:
+            return False
+        if 'Seq Scan' in line:
+            return False
+    return True
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Apply pending schema migrations."""
+    upgrade_db()
+
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """EXPLAIN every hot query and fail if one reads a whole table."""
+    failed = False
+    for name, query in hot_queries().items():
+        plan = explain_query(query)
+        ok = uses_index(plan)
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {name}: {' | '.join(plan)}")
+    db.session.rollback()
+    sys.exit(1 if failed else 0)
+
+
 # ==================== DATABASE INITIALIZATION ====================
 
-def init_db():
-    """Initialize database with products"""
-    with app.app_context():
-        db.create_all()
+def seed_products():
+    """Add the HimGaon Dairy catalog to an empty products table, returns the number added"""
+    if Product.query.first() is None:
+        products = [
+            Product(
+                name_en="Fresh Cow Milk",
+                name_hi="ताजा गाय का दूध",
+                price=60.0,
+                description_en="Pure cow milk from Pithoragarh hills, 1 liter",
+                description_hi="पिथौरागढ़ की पहाड़ियों से शुद्ध गाय का दूध, 1 लीटर",
+                image_url="https://images.unsplash.com/photo-1563636619-e9143da7973b?w=500",
+                stock=50,
+                category="milk"
+            ),
+            Product(
+                name_en="Buffalo Milk",
+                name_hi="भैंस का दूध",
+                price=70.0,
+                description_en="Rich buffalo milk from local farms, 1 liter",
+                description_hi="स्थानीय फार्म से भैंस का दूध, 1 लीटर",
+                image_url="https://images.unsplash.com/photo-1550583724-b2692b85b150?w=500",
+                stock=40,
+                category="milk"
+            ),
+            Product(
+                name_en="Buttermilk (Chaach)",
+                name_hi="छाछ",
+                price=30.0,
+                description_en="Traditional Uttarakhandi buttermilk, 1 liter",
+                description_hi="पारंपरिक उत्तराखंडी छाछ, 1 लीटर",
+                image_url="https://images.unsplash.com/photo-1623065422902-30a2d299bbe4?w=500",
+                stock=60,
+                category="buttermilk"
+            ),
+            Product(
+                name_en="Fresh Dahi (Curd)",
+                name_hi="ताजा दही",
+                price=50.0,
+                description_en="Homemade fresh dahi from Pithoragarh, 500g",
+                description_hi="पिथौरागढ़ से घर का बना ताजा दही, 500 ग्राम",
+                image_url="https://images.unsplash.com/photo-1571212515416-26996e2fd0ae?w=500",
+                stock=45,
+                category="dahi"
+            ),
+            Product(
+                name_en="Pure Desi Ghee",
+                name_hi="शुद्ध देसी घी",
+                price=650.0,
+                description_en="100% pure cow ghee from Uttarakhand, 1 kg",
+                description_hi="उत्तराखंड से 100% शुद्ध गाय का घी, 1 किलो",
+                image_url="https://images.unsplash.com/photo-1587048411932-a04b46f98efe?w=500",
+                stock=30,
+                category="ghee"
+            ),
+            Product(
+                name_en="Mountain Butter",
+                name_hi="पहाड़ी मक्खन",
+                price=200.0,
+                description_en="Hand-churned butter from Pithoragarh, 500g",
+                description_hi="पिथौरागढ़ से हाथ से मथा मक्खन, 500 ग्राम",
+                image_url="https://images.unsplash.com/photo-1589985270826-4b7bb135bc9d?w=500",
+                stock=35,
+                category="butter"
+            ),
+            Product(
+                name_en="Free Range Eggs",
+                name_hi="देसी अंडे",
+                price=80.0,
+                description_en="Fresh free-range eggs from mountain farms, 6 pieces",
+                description_hi="पहाड़ी फार्म से ताजे देसी अंडे, 6 पीस",
+                image_url="https://images.unsplash.com/photo-1582722872445-44dc5f7e3c8f?w=500",
+                stock=100,
+                category="eggs"
+            )
+        ]
         
-        if Product.query.count() == 0:
-            products = [
-                Product(
-                    name_en="Fresh Cow Milk",
-                    name_hi="ताजा गाय का दूध",
-                    price=60.0,
-                    description_en="Pure cow milk from Pithoragarh hills, 1 liter",
-                    description_hi="पिथौरागढ़ की पहाड़ियों से शुद्ध गाय का दूध, 1 लीटर",
-                    image_url="https://images.unsplash.com/photo-1563636619-e9143da7973b?w=500",
-                    stock=50,
-                    category="milk"
-                ),
-                Product(
-                    name_en="Buffalo Milk",
-                    name_hi="भैंस का दूध",
-                    price=70.0,
-                    description_en="Rich buffalo milk from local farms, 1 liter",
-                    description_hi="स्थानीय फार्म से भैंस का दूध, 1 लीटर",
-                    image_url="https://images.unsplash.com/photo-1550583724-b2692b85b150?w=500",
-                    stock=40,
-                    category="milk"
-                ),
-                Product(
-                    name_en="Buttermilk (Chaach)",
-                    name_hi="छाछ",
-                    price=30.0,
-                    description_en="Traditional Uttarakhandi buttermilk, 1 liter",
-                    description_hi="पारंपरिक उत्तराखंडी छाछ, 1 लीटर",
-                    image_url="https://images.unsplash.com/photo-1623065422902-30a2d299bbe4?w=500",
-                    stock=60,
-                    category="buttermilk"
-                ),
-                Product(
-                    name_en="Fresh Dahi (Curd)",
-                    name_hi="ताजा दही",
-                    price=50.0,
-                    description_en="Homemade fresh dahi from Pithoragarh, 500g",
-                    description_hi="पिथौरागढ़ से घर का बना ताजा दही, 500 ग्राम",
-                    image_url="https://images.unsplash.com/photo-1571212515416-26996e2fd0ae?w=500",
-                    stock=45,
-                    category="dahi"
-                ),
-                Product(
-                    name_en="Pure Desi Ghee",
-                    name_hi="शुद्ध देसी घी",
-                    price=650.0,
-                    description_en="100% pure cow ghee from Uttarakhand, 1 kg",
-                    description_hi="उत्तराखंड से 100% शुद्ध गाय का घी, 1 किलो",
-                    image_url="https://images.unsplash.com/photo-1587048411932-a04b46f98efe?w=500",
-                    stock=30,
-                    category="ghee"
-                ),
-                Product(
-                    name_en="Mountain Butter",
-                    name_hi="पहाड़ी मक्खन",
-                    price=200.0,
-                    description_en="Hand-churned butter from Pithoragarh, 500g",
-                    description_hi="पिथौरागढ़ से हाथ से मथा मक्खन, 500 ग्राम",
-                    image_url="https://images.unsplash.com/photo-1589985270826-4b7bb135bc9d?w=500",
-                    stock=35,
-                    category="butter"
-                ),
-                Product(
-                    name_en="Free Range Eggs",
-                    name_hi="देसी अंडे",
-                    price=80.0,
-                    description_en="Fresh free-range eggs from mountain farms, 6 pieces",
-                    description_hi="पहाड़ी फार्म से ताजे देसी अंडे, 6 पीस",
-                    image_url="https://images.unsplash.com/photo-1582722872445-44dc5f7e3c8f?w=500",
-                    stock=100,
-                    category="eggs"
-                )
-            ]
-            
-            db.session.bulk_save_objects(products)
-            db.session.commit()
-            print("✅ Database initialized with HimGaon Dairy products")
-        else:
-            print("✅ Database already contains products")
+        db.session.add_all(products)
+        db.session.flush()
+        for product in products:
+            product.sku = default_sku(product.id)
+        record_stock_movements(stock_movement('opening', p.id, p.stock) for p in products)
+        db.session.commit()
+        return len(products)
+    return 0
 
 
-# Initialize database on startup (works with Gunicorn too)
-with app.app_context():
-    init_db()
+# Nothing touches the database at import time: gunicorn --preload imports the app once
+# in the master, so schema and sample data are set up by these commands before it starts.
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the tables or apply pending migrations."""
+    upgrade_db()
+    print("✅ Database schema is up to date")
+
+
+@app.cli.command('seed')
+def seed_command():
+    """Add the sample catalog when there are no products yet."""
+    if seed_products():
+        print("✅ Database initialized with HimGaon Dairy products")
+    else:
+        print("✅ Database already contains products")
 
 
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
+    # A local run prepares its own database; deployments run 'flask init-db' and 'flask seed'
+    with app.app_context():
+        upgrade_db()
+        seed_products()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
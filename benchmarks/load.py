@@ -0,0 +1,383 @@
+"""
+HimGaon Dairy — storefront and checkout load benchmark
+Seeds a SQLite database with a realistic catalog and order history, then
+drives the storefront, cart, checkout, tracking and admin pages and reports
+throughput, p50/p99 latency and SQL queries per request as JSON.
+
+Runs in-process through the Flask test client by default, or against a
+local gunicorn with --server gunicorn (queries are only counted in-process).
+Results can be saved as a baseline and later checked against it:
+
+    python benchmarks/load.py --save-baseline
+    python benchmarks/load.py --check
+
+Usage: python benchmarks/load.py [--products N] [--orders N] [--requests N]
+                                 [--server test-client|gunicorn] [--workers N] [--concurrency N]
+                                 [--database PATH] [--output FILE] [--save-baseline | --check]
+"""
+
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, 'benchmarks', 'baselines')
+STATUSES = ['Delivered'] * 14 + ['Accepted'] * 2 + ['Pending'] * 3 + ['Rejected']
+CATEGORIES = ['milk', 'dahi', 'ghee', 'butter', 'buttermilk', 'paneer', 'sweets', 'eggs']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Storefront and checkout load benchmark')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+    parser.add_argument('--server', choices=['test-client', 'gunicorn'], default='test-client')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Client threads against gunicorn.')
+    parser.add_argument('--database', help='SQLite file to seed or reuse (default: a temporary file).')
+    parser.add_argument('--output', help='Also write the JSON results to this file.')
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help='Allowed slowdown against the baseline, 1.0 = twice as slow (default).')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--save-baseline', action='store_true')
+    mode.add_argument('--check', action='store_true', help='Exit 1 when a scenario regressed against the baseline.')
+    return parser.parse_args()
+
+
+args = parse_args()
+database = args.database or os.path.join(tempfile.mkdtemp(), 'load.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(database)
+os.environ.setdefault('SECRET_KEY', 'load-benchmark')
+os.environ.setdefault('SLOW_REQUEST_MS', '0')
+os.environ.setdefault('NOTIFY_TRANSPORT', 'file:' + os.path.join(os.path.dirname(os.path.abspath(database)),
+                                                                   'notifications.jsonl'))
+sys.path.insert(0, ROOT)
+
+from app import (app, db, Product, Order, OrderItem, count_queries, order_id_allocator,  # noqa: E402
+                 record_stock_movements, stock_movement, default_sku, rebuild_order_stats,
+                 backfill_product_sales, bump_catalog_version, upgrade_db, seed_products)
+
+
+# ==================== SEEDING ====================
+
+def seed(products, orders, batch_size=5000):
+    """Insert products and a year of order history with executemany, unless already there"""
+    rng = random.Random(2025)
+    with app.app_context():
+        # Keep stdout clean for the JSON results
+        with contextlib.redirect_stdout(sys.stderr):
+            upgrade_db()
+        seed_products()
+        have_products = db.session.query(Product).count()
+        if have_products < products:
+            rows = [{
+                'name_en': f'Product {n}', 'name_hi': f'उत्पाद {n}', 'price': float(rng.randrange(20, 800, 5)),
+                'description_en': f'Fresh dairy item number {n} from the hills',
+                'description_hi': f'पहाड़ों से ताज़ा डेयरी उत्पाद {n}',
+                'image_url': '', 'stock': 10 ** 6, 'reserved': 0, 'category': rng.choice(CATEGORIES),
+            } for n in range(have_products, products)]
+            inserted = db.session.execute(db.insert(Product).returning(Product.id), rows).scalars().all()
+            db.session.execute(db.update(Product), [{'id': pid, 'sku': default_sku(pid)} for pid in inserted])
+            record_stock_movements(stock_movement('opening', product_id, 10 ** 6) for product_id in inserted)
+            bump_catalog_version()
+            db.session.commit()
+
+        catalog = db.session.execute(db.select(Product.id, Product.name_en, Product.name_hi, Product.price)).all()
+        have_orders = db.session.query(Order).count()
+        now = datetime.utcnow()
+        remaining = orders - have_orders
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            year = datetime.now().year - 1
+            order_ids = order_id_allocator.reserve(count, year)
+            order_rows = []
+            for order_id in order_ids:
+                placed = now - timedelta(seconds=rng.uniform(0, 365 * 86400))
+                order_rows.append({
+                    'order_id': order_id, 'customer_name': f'Customer {rng.randrange(50000)}',
+                    'email': 'customer@example.com', 'phone': f'9{rng.randrange(10 ** 9):09d}',
+                    'address': f'House {rng.randrange(500)}, Village {rng.randrange(300)}, Pithoragarh',
+                    'status': rng.choice(STATUSES), 'total_amount': 0.0,
+                    'order_date': placed, 'updated_at': placed,
+                })
+            lines = {}
+            for row in order_rows:
+                picked = rng.sample(catalog, rng.randint(1, 3))
+                lines[row['order_id']] = [(product, rng.randint(1, 4)) for product in picked]
+                row['total_amount'] = sum(product.price * quantity for product, quantity in lines[row['order_id']])
+            pks = dict((order_id, pk) for pk, order_id in db.session.execute(
+                db.insert(Order).returning(Order.id, Order.order_id), order_rows))
+            db.session.execute(db.insert(OrderItem), [{
+                'order_id': pks[order_id], 'product_id': product.id, 'quantity': quantity, 'price': product.price,
+                'product_name_en': product.name_en, 'product_name_hi': product.name_hi,
+            } for order_id, items in lines.items() for product, quantity in items])
+            db.session.commit()
+            remaining -= count
+
+        if have_orders < orders:
+            rebuild_order_stats()
+            db.session.commit()
+            backfill_product_sales()
+
+        tracked = db.session.execute(
+            db.select(Order.order_id, Order.phone).order_by(db.func.random()).limit(500)).all()
+        product_ids = [product.id for product in catalog]
+        db.session.remove()
+    return [tuple(row) for row in tracked], product_ids
+
+
+# ==================== CLIENTS ====================
+
+class HttpResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """Cookie-keeping HTTP client with the get/post shape of the Flask test client"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=30) as response:
+                return HttpResponse(response.status, response.read().decode())
+        except urllib.error.HTTPError as e:
+            return HttpResponse(e.code, e.read().decode(errors='replace'))
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data=None):
+        return self._open(path, data or {})
+
+
+def admin_client(client):
+    client.post('/admin/login', data={'username': 'admin', 'password': 'himgaon2025'})
+    return client
+
+
+# ==================== SCENARIOS ====================
+
+def scenarios(tracked, product_ids):
+    """name -> (setup, request); setup runs untimed before every measured request"""
+    rng = random.Random(7)
+
+    def fill_cart(client):
+        client.product_id = rng.choice(product_ids)
+        client.post(f'/add-to-cart/{client.product_id}', data={'quantity': 1})
+
+    def checkout_form(client):
+        fill_cart(client)
+        token = re.search(r'name="checkout_token" value="([^"]+)"', client.get('/checkout').text)
+        client.form = {'customer_name': 'Load Test', 'email': 'load@example.com', 'phone': '9000000000',
+                       'address': 'Bench Lane, Pithoragarh', 'checkout_token': token.group(1) if token else ''}
+
+    def track(client):
+        order_id, phone = rng.choice(tracked)
+        return client.post('/track-order', data={'order_id': order_id, 'phone': phone})
+
+    return {
+        'index': (None, lambda client: client.get('/')),
+        'cart_add': (None, lambda client: client.post(f'/add-to-cart/{rng.choice(product_ids)}',
+                                                      data={'quantity': 1})),
+        'cart_update': (fill_cart, lambda client: client.post(f'/update-cart/{client.product_id}',
+                                                              data={'quantity': rng.randint(1, 3)})),
+        'place_order': (checkout_form, lambda client: client.post('/place-order', data=client.form)),
+        'track_order': (None, track),
+        'admin_orders': ('admin', lambda client: client.get('/admin/orders')),
+        'admin_dashboard': ('admin', lambda client: client.get('/admin/dashboard')),
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def measure(make_client, setup, send, requests, concurrency, count_sql):
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(share):
+        client = make_client()
+        if setup == 'admin':
+            admin_client(client)
+        for _ in range(share):
+            if callable(setup):
+                setup(client)
+            started = time.perf_counter()
+            if count_sql:
+                with app.app_context(), count_queries() as statements:
+                    response = send(client)
+            else:
+                statements, response = None, send(client)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if statements is not None:
+                    queries.append(len(statements))
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(share,)) for share in shares if share]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Throughput over measured time only, so untimed setup requests do not count against a scenario
+    busy = sum(latencies) / len(threads)
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / busy, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+# ==================== GUNICORN ====================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning'],
+        cwd=ROOT, env=os.environ.copy(), stdout=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=1)
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('❌ gunicorn did not start within 30 seconds')
+
+
+# ==================== BASELINES ====================
+
+def baseline_path(server):
+    return os.path.join(BASELINES, f'{server}.json')
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for every scenario worse than the baseline"""
+    problems = []
+    if baseline['meta']['products'] != results['meta']['products'] or \
+            baseline['meta']['orders'] != results['meta']['orders']:
+        problems.append(f"baseline was recorded with {baseline['meta']['products']} products and "
+                        f"{baseline['meta']['orders']} orders - rerun with the same sizes")
+        return problems
+
+    for name, base in baseline['scenarios'].items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            problems.append(f'{name}: scenario missing')
+            continue
+        if current['errors']:
+            problems.append(f"{name}: {current['errors']} error responses")
+        # A few ms of scheduler noise on a fast route is not a regression
+        if current['p99_ms'] > base['p99_ms'] * (1 + tolerance) + 10:
+            problems.append(f"{name}: p99 {current['p99_ms']} ms > baseline {base['p99_ms']} ms")
+        if current['rps'] * (1 + tolerance) < base['rps']:
+            problems.append(f"{name}: {current['rps']} req/s < baseline {base['rps']} req/s")
+        if base['queries_per_request'] is not None and current['queries_per_request'] is not None and \
+                current['queries_per_request'] > base['queries_per_request'] + 0.5:
+            problems.append(f"{name}: {current['queries_per_request']} queries/request > "
+                            f"baseline {base['queries_per_request']}")
+    return problems
+
+
+def main():
+    started = time.perf_counter()
+    tracked, product_ids = seed(args.products, args.orders)
+    print(f"Seeded {args.products} products and {args.orders} orders in {time.perf_counter() - started:.1f}s "
+          f"({database})", file=sys.stderr)
+
+    process = None
+    if args.server == 'gunicorn':
+        process, base_url = start_gunicorn(args.workers)
+        make_client, concurrency, count_sql = (lambda: HttpClient(base_url)), args.concurrency, False
+    else:
+        make_client, concurrency, count_sql = app.test_client, 1, True
+
+    try:
+        results = {
+            'meta': {'server': args.server, 'products': args.products, 'orders': args.orders,
+                     'requests': args.requests, 'concurrency': concurrency, 'python': platform.python_version()},
+            'scenarios': {},
+        }
+        for name, (setup, send) in scenarios(tracked, product_ids).items():
+            results['scenarios'][name] = stats = measure(make_client, setup, send, args.requests,
+                                                         concurrency, count_sql)
+            queries = '-' if stats['queries_per_request'] is None else stats['queries_per_request']
+            print(f"{name:<16} {stats['rps']:9.1f} req/s  p50 {stats['p50_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  queries {queries}", file=sys.stderr)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(output + '\n')
+
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(baseline_path(args.server), 'w') as out:
+            out.write(output + '\n')
+        print(f"✅ Baseline saved to {baseline_path(args.server)}", file=sys.stderr)
+
+    if args.check:
+        if not os.path.exists(baseline_path(args.server)):
+            sys.exit(f"❌ No baseline at {baseline_path(args.server)}, record one with --save-baseline")
+        with open(baseline_path(args.server)) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"❌ {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print("✅ No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
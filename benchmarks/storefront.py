@@ -0,0 +1,51 @@
+"""
+HimGaon Dairy — storefront render benchmark
+Compares homepage requests per second with a cold render, a warm
+fragment cache and a conditional GET answered with 304 Not Modified.
+
+Usage: python benchmarks/storefront.py [requests]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, fragment_cache, upgrade_db, seed_products  # noqa: E402
+
+
+def run(client, requests, before=None, headers=None):
+    """Return requests per second for GET / repeated `requests` times"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        if before:
+            before()
+        response = client.get('/', headers=headers or {})
+        assert response.status_code in (200, 304), response.status_code
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with app.app_context():
+        upgrade_db()
+        seed_products()
+    client = app.test_client()
+    etag = client.get('/').headers['ETag']
+
+    results = {
+        'cold render (before)': run(client, requests, before=fragment_cache.clear),
+        'fragment cache': run(client, requests),
+        'conditional GET (304)': run(client, requests, headers={'If-None-Match': etag}),
+    }
+
+    baseline = results['cold render (before)']
+    for name, rps in results.items():
+        print(f"{name:<24} {rps:10.1f} req/s  x{rps / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
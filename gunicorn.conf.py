@@ -0,0 +1,26 @@
+"""
+HimGaon Dairy — gunicorn settings shared by every deployment
+Usage: gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app) and forked into the
+workers, so workers boot without importing anything. Importing the app
+opens no database connection, and post_fork resets the pool anyway so
+no socket is ever shared between processes. Run 'flask init-db' and
+'flask seed' before starting.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+timeout = 30
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    from app import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,69 @@
+"""
+Shared fixtures. The app reads its settings from the environment at import,
+so the database is chosen here before app.py is imported: a throwaway
+SQLite file, or TEST_DATABASE_URL to run the same tests against Postgres.
+
+Usage: python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp(prefix='himgaon-tests-')
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+os.environ.setdefault('NOTIFY_TRANSPORT', f"file:{os.path.join(_tmp, 'outbox.jsonl')}")
+
+from app import app, db, upgrade_db, seed_products, bump_catalog_version, Product  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def database():
+    """Schema and sample catalog, set up once - tests add the rows they need"""
+    app.config['TESTING'] = True
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            db.drop_all()
+        upgrade_db()
+        seed_products()
+    return db
+
+
+@pytest.fixture
+def ctx(database):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@pytest.fixture
+def admin(database):
+    return admin_client()
+
+
+def admin_client():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    return client
+
+
+def make_product(stock, price=50.0, name='Test Milk'):
+    """Add a product of its own to a test and return its id"""
+    product = Product(name_en=name, name_hi='परीक्षण दूध', price=price, stock=stock, category='test')
+    db.session.add(product)
+    db.session.flush()
+    product.sku = f'TEST-{product.id}'
+    bump_catalog_version()
+    db.session.commit()
+    return product.id
+
+
+def checkout_form(name='Test Customer', phone='9000000000'):
+    return {'customer_name': name, 'email': 'test@example.com', 'phone': phone, 'address': 'Berinag'}
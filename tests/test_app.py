@@ -0,0 +1,174 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import admin_client, checkout_form, make_product
+from app import (app, db, count_queries, explain_query, hot_queries, reserve_stock, search_orders,
+                 uses_index, OrderIdAllocator, Order, OrderItem, OrderStat, Product, Reservation)
+
+
+# ==================== CHECKOUT ====================
+
+def test_reserve_stock_reports_failed_lines(ctx):
+    plenty, scarce = make_product(stock=10), make_product(stock=2)
+
+    failed = reserve_stock({plenty: 3, scarce: 5})
+    db.session.rollback()
+
+    assert failed == [scarce]
+
+
+def test_parallel_checkouts_never_oversell(ctx):
+    stock, customers = 20, 200
+    product_id = make_product(stock=customers)
+
+    clients = []
+    for i in range(customers):
+        client = app.test_client()
+        assert client.post(f'/add-to-cart/{product_id}', data={'quantity': 1}).json['success']
+        clients.append(client)
+
+    # Drop the cart holds and most of the stock, so the checkouts race for it in reserve_stock
+    db.session.execute(db.delete(Reservation).where(Reservation.product_id == product_id))
+    db.session.execute(db.update(Product).where(Product.id == product_id).values(stock=stock, reserved=0))
+    db.session.commit()
+
+    def checkout(numbered_client):
+        number, client = numbered_client
+        return client.post('/place-order', data=checkout_form(phone=f'9{number:09d}')).location
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        locations = list(pool.map(checkout, enumerate(clients)))
+
+    db.session.expire_all()
+    sold = db.session.scalar(db.select(db.func.count(OrderItem.id)).where(OrderItem.product_id == product_id))
+    assert sold == stock
+    assert sum('/order-confirmation/' in location for location in locations) == stock
+    assert db.session.get(Product, product_id).stock == 0
+    assert db.session.scalar(db.select(db.func.count(db.distinct(Order.order_id)))
+                             .join(OrderItem).where(OrderItem.product_id == product_id)) == stock
+
+
+# ==================== ORDER IDS ====================
+
+def test_parallel_allocators_hand_out_unique_ids(database):
+    # Each allocator stands for one gunicorn worker with its own block of numbers
+    workers = [OrderIdAllocator(block_size=size) for size in (1, 3, 10, 10)]
+    per_thread = 150
+
+    def allocate(allocator):
+        with app.app_context():
+            ids = [allocator.next_id(year=2091) for _ in range(per_thread)]
+            ids += allocator.reserve(5, year=2091)
+            db.session.remove()
+            return ids
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(allocate, workers * 2))
+
+    issued = [order_id for ids in results for order_id in ids]
+    assert len(issued) == len(set(issued)) == 8 * (per_thread + 5)
+    assert all(order_id.startswith('HGD2091') for order_id in issued)
+    # Past 999 the number just grows a digit
+    assert max(int(order_id[len('HGD2091'):]) for order_id in issued) > 999
+
+
+def test_allocator_restarts_every_year(database):
+    allocator = OrderIdAllocator(block_size=5)
+    with app.app_context():
+        assert allocator.next_id(year=2092) == 'HGD2092001'
+        assert allocator.next_id(year=2093) == 'HGD2093001'
+        assert allocator.next_id(year=2092) == 'HGD2092002'
+
+
+# ==================== QUERY COUNTS ====================
+
+def place_order_with_lines(lines):
+    """Check out one unit each of `lines` new products, returns the order's primary key"""
+    client = app.test_client()
+    for _ in range(lines):
+        client.post(f'/add-to-cart/{make_product(stock=10)}', data={'quantity': 1})
+    location = client.post('/place-order', data=checkout_form()).location
+    order_id = location.rsplit('/', 1)[1]
+    return db.session.scalar(db.select(Order.id).where(Order.order_id == order_id))
+
+
+def queries_for(admin, method, url_for_order, lines):
+    order = place_order_with_lines(lines)
+    with count_queries() as statements:
+        response = getattr(admin, method)(url_for_order(order))
+    assert response.status_code in (200, 302)
+    return len(statements)
+
+
+def test_order_detail_queries_do_not_grow_with_lines(ctx, admin):
+    detail = lambda order: f'/admin/orders/{order}'
+    queries_for(admin, 'get', detail, 1)  # warm the per-worker caches
+
+    assert queries_for(admin, 'get', detail, 1) == queries_for(admin, 'get', detail, 8)
+
+
+def test_reject_queries_do_not_grow_with_lines(ctx, admin):
+    reject = lambda order: f'/admin/orders/{order}/reject'
+    queries_for(admin, 'post', reject, 1)
+
+    assert queries_for(admin, 'post', reject, 1) == queries_for(admin, 'post', reject, 8)
+
+
+def status_counts():
+    return dict(db.session.execute(
+        db.select(OrderStat.status, db.func.sum(OrderStat.orders)).group_by(OrderStat.status)).all())
+
+
+def test_concurrent_bulk_rejects_restock_once(ctx):
+    product_id = make_product(stock=10)
+    clients = [admin_client(), admin_client()]
+
+    for _ in range(5):
+        customer = app.test_client()
+        customer.post(f'/add-to-cart/{product_id}', data={'quantity': 2})
+        order_id = customer.post('/place-order', data=checkout_form()).location.rsplit('/', 1)[1]
+        order = db.session.scalar(db.select(Order.id).where(Order.order_id == order_id))
+        before = status_counts()
+
+        start = threading.Barrier(len(clients))
+
+        def reject(client):
+            start.wait()
+            return client.post('/admin/orders/bulk', data={'action': 'reject', 'order_ids': [order]},
+                               headers={'Accept': 'application/json'}).json
+
+        with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            responses = list(pool.map(reject, clients))
+
+        db.session.expire_all()
+        assert sum(response.get('updated', 0) for response in responses) == 1
+        assert db.session.get(Product, product_id).stock == 10
+        after = status_counts()
+        assert after['Pending'] == before['Pending'] - 1
+        assert after['Rejected'] == before.get('Rejected', 0) + 1
+
+
+def test_order_search_ignores_name_case(ctx):
+    product_id = make_product(stock=5)
+    customer = app.test_client()
+    customer.post(f'/add-to-cart/{product_id}', data={'quantity': 1})
+    customer.post('/place-order', data=checkout_form(name='Ramesh Joshi'))
+
+    for search in ('ramesh', 'RAMESH', 'Rames'):
+        names = {order.customer_name for order in search_orders(Order.query, search)}
+        assert 'Ramesh Joshi' in names
+
+# ==================== INDEXES ====================
+
+with app.app_context():
+    HOT_QUERIES = sorted(hot_queries())
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_an_index(ctx, name):
+    plan = explain_query(hot_queries()[name])
+    db.session.rollback()
+
+    assert uses_index(plan), ' | '.join(plan)